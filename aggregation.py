@@ -0,0 +1,101 @@
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from tracing import traced
+
+METRICS = ('Views', 'Likes', 'Comments')
+
+MONTH_ORDER = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+DAY_OF_WEEK_ORDER = list(calendar.day_name)
+
+# Ordered axes are built once and shared by every aggregation
+MONTH_DTYPE = pd.CategoricalDtype(MONTH_ORDER, ordered=True)
+DAY_OF_WEEK_DTYPE = pd.CategoricalDtype(DAY_OF_WEEK_ORDER, ordered=True)
+
+
+def _month(df):
+    return df['Published_date'].dt.month.to_numpy() - 1, pd.Categorical(MONTH_ORDER, dtype=MONTH_DTYPE), None
+
+
+def _day_of_month(df):
+    return df['Published_date'].dt.day.to_numpy() - 1, np.arange(1, 32), None
+
+
+def _day_of_week(df):
+    return (df['Published_date'].dt.dayofweek.to_numpy(),
+            pd.Categorical(DAY_OF_WEEK_ORDER, dtype=DAY_OF_WEEK_DTYPE), None)
+
+
+def _hour(df):
+    return df['Published_date'].dt.hour.to_numpy(), np.arange(24), None
+
+
+def _year(df):
+    years = df['Published_date'].dt.year.to_numpy()
+    first = years.min() if len(years) else 0
+    return years - first, np.arange(first, first + (years.max() - first + 1 if len(years) else 0)), None
+
+
+def _tag(df):
+    # Multi-valued dimension: one (row, tag) pair per tag of every video
+    lengths = df['Tags'].map(len).to_numpy()
+    rows = np.repeat(np.arange(len(df)), lengths)
+    codes, labels = pd.factorize(pd.Series([tag for tags in df['Tags'] for tag in tags], dtype=object))
+    return codes, np.asarray(labels, dtype=object), rows
+
+
+# Each dimension maps the frame to (integer codes, axis labels, row of each code or None for one code per row)
+DIMENSIONS = {
+    'Month': _month,
+    'Day_of_Month': _day_of_month,
+    'Day_of_Week': _day_of_week,
+    'Hour': _hour,
+    'Year': _year,
+    'Tag': _tag,
+}
+
+
+def register_dimension(name, extract):
+    DIMENSIONS[name] = extract
+
+
+@traced()
+def aggregate(df, dimensions=('Month', 'Day_of_Month', 'Day_of_Week'), metrics=METRICS):
+    """
+        Count, sum and mean of each metric for every dimension, with one bincount per column.
+
+        Parameters:
+        - df (DataFrame): Video statistics with a Published_date column.
+        - dimensions (iterable): Names registered in DIMENSIONS.
+        - metrics (iterable): Numeric columns to aggregate.
+
+        Returns:
+        - distributions (dict): One frame per dimension with Count, <metric> (mean) and <metric>_sum
+          columns, sorted along the dimension and restricted to observed values.
+    """
+    values = {}
+    for metric in metrics:
+        column = df[metric].to_numpy(dtype=float, na_value=np.nan)
+        values[metric] = (np.nan_to_num(column), ~np.isnan(column))
+
+    distributions = {}
+    for name in dimensions:
+        codes, labels, rows = DIMENSIONS[name](df)
+        size = len(labels)
+        count = np.bincount(codes, minlength=size)
+        result = {name: labels, 'Count': count}
+
+        for metric, (column, valid) in values.items():
+            if rows is not None:
+                column, valid = column[rows], valid[rows]
+            sums = np.bincount(codes, weights=column, minlength=size)
+            observed = np.bincount(codes, weights=valid, minlength=size)
+            result[metric] = np.divide(sums, observed, out=np.full(size, np.nan), where=observed > 0)
+            result[f'{metric}_sum'] = sums
+
+        distribution = pd.DataFrame(result)
+        distributions[name] = distribution[distribution['Count'] > 0].reset_index(drop=True)
+
+    return distributions
\ No newline at end of file
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from constants import BASE_URL, REQUEST_TIMEOUT, HTTP_POOL_SIZE, MAX_API_RETRIES, API_RECORD_DIR
+from key_manager import key_manager
+
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+# All endpoints are called over plain REST on one pooled session, so there is no
+# discovery document to fetch and TLS connections are reused between calls.
+_session = None
+_session_lock = threading.Lock()
+
+
+class YouTubeAPIError(Exception):
+    def __init__(self, status, reason, message):
+        super().__init__(f'{status} {reason}: {message}')
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _raise_for_response(response):
+    if response.ok:
+        return
+
+    reason = ''
+    message = response.text
+    try:
+        error = response.json().get('error', {})
+        message = error.get('message', message)
+        if error.get('errors'):
+            reason = error['errors'][0].get('reason', '')
+    except ValueError:
+        pass
+
+    raise YouTubeAPIError(response.status_code, reason, message)
+
+
+def fixture_key(endpoint, params):
+    # Stable name for a recorded response, independent of the API key and parameter order
+    canonical = json.dumps({'endpoint': endpoint, 'params': {k: str(v) for k, v in params.items()}}, sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def _record(endpoint, params, data):
+    directory = os.path.join(API_RECORD_DIR, endpoint)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, fixture_key(endpoint, params) + '.json'), 'w') as f:
+        json.dump(data, f)
+
+
+def api_get(endpoint, params):
+    """
+        Call a YouTube Data API endpoint with a key chosen by the quota-aware key manager.
+
+        Parameters:
+        - endpoint (str): The resource path, e.g. 'videos' or 'playlistItems'.
+        - params (dict): Query parameters without the API key.
+
+        Returns:
+        - data (dict): The decoded JSON response.
+    """
+    session = get_session()
+    error = None
+    retries = 0
+    while retries <= MAX_API_RETRIES:
+        api_key = key_manager.acquire(endpoint)
+        if api_key is None:
+            break
+
+        try:
+            response = session.get(f'{BASE_URL}/{endpoint}', params={**params, 'key': api_key},
+                                   timeout=REQUEST_TIMEOUT)
+            _raise_for_response(response)
+            data = response.json()
+            if API_RECORD_DIR:
+                _record(endpoint, params, data)
+            return data
+        except YouTubeAPIError as e:
+            error = e
+            if e.status == 403 and e.reason in QUOTA_REASONS:
+                # Move on to the next key straight away, this one is done for the day.
+                key_manager.mark_exhausted(api_key)
+                continue
+            if e.status != 429 and e.reason not in RATE_LIMIT_REASONS and e.status < 500:
+                raise
+        except requests.RequestException as e:
+            error = e
+
+        key_manager.backoff(retries)
+        retries += 1
+
+    raise error if error is not None else YouTubeAPIError(403, 'quotaExceeded', 'All API keys are out of quota')
+
+
+def chunked(items, size=50):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+    Headless batch analysis of many channels.
+
+    Example:
+        python batch_cli.py channels.txt --output results --recommend --format parquet
+
+    Channel analytics and recommendations run on a thread pool, so the models are loaded once,
+    in this process or behind MODEL_SERVER_URL. Generations from concurrent channels are batched
+    by the shared inference worker. Only the CPU-bound clustering of representative videos runs
+    on a process pool.
+    Completed channel IDs are appended to a checkpoint file, so rerunning the same command
+    after a crash resumes where it stopped.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+
+from pipeline import fetch_channel_data, get_recommendations
+from representatives import select_representatives
+from utility import load_descriptions
+
+
+def read_channel_ids(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _append_line(path, line):
+    with open(path, 'a') as f:
+        f.write(line + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def summarize_channel(channel_id, data):
+    videos = data['all_video_details']
+    record = {
+        'channel_id': channel_id,
+        'title': data['snippet'].get('title'),
+        'published_at': data['publishedAt'],
+        'country': data['country'],
+        'subscribers': int(data['statistics'].get('subscriberCount', 0)),
+        'total_views': int(data['statistics'].get('viewCount', 0)),
+        'video_count': len(videos),
+    }
+    for metric in ('Views', 'Likes', 'Comments'):
+        record[f'{metric.lower()}_total'] = int(videos[metric].sum())
+        record[f'{metric.lower()}_mean'] = float(videos[metric].mean()) if len(videos) else None
+
+    record['distributions'] = {
+        name: json.loads(distribution.astype({name: str}).to_json(orient='records'))
+        for name, distribution in data['distributions'].items()
+    }
+    return record
+
+
+def select_in_process(processes, embeddings):
+    return processes.submit(select_representatives, embeddings).result()
+
+
+class BatchRunner:
+    def __init__(self, output, output_format='jsonl', recommend=False, threads=8, processes=2,
+                 max_in_flight=32, refresh=False):
+        os.makedirs(output, exist_ok=True)
+        self.output = output
+        self.output_format = output_format
+        self.recommend = recommend
+        self.refresh = refresh
+        self.threads = threads
+        self.processes = processes
+        self.max_in_flight = max_in_flight
+        self.results_path = os.path.join(output, 'channels.jsonl')
+        self.errors_path = os.path.join(output, 'errors.jsonl')
+        self.checkpoint_path = os.path.join(output, 'checkpoint.txt')
+        self.completed = 0
+        self.failed = 0
+
+    def _write_result(self, record, videos):
+        if self.output_format == 'parquet':
+            videos_dir = os.path.join(self.output, 'videos')
+            os.makedirs(videos_dir, exist_ok=True)
+            # Descriptions are not kept in memory by the pipeline, they are read back for the export
+            videos = videos.assign(Description=load_descriptions(videos['Video_id']))
+            videos.to_parquet(os.path.join(videos_dir, f"{record['channel_id']}.parquet"))
+        _append_line(self.results_path, json.dumps(record))
+        # Only checkpoint once the result is durable, so a crash never loses a channel
+        _append_line(self.checkpoint_path, record['channel_id'])
+        self.completed += 1
+
+    def _write_error(self, channel_id, stage, error):
+        print(f'{channel_id}: {stage} failed: {error}')
+        _append_line(self.errors_path, json.dumps({'channel_id': channel_id, 'stage': stage, 'error': str(error)}))
+        self.failed += 1
+
+    def _report(self, start, total):
+        elapsed = time.perf_counter() - start
+        rate = self.completed / elapsed * 60 if elapsed > 0 else 0.0
+        print(f'{self.completed + self.failed}/{total} channels ({self.failed} failed), {rate:.1f} channels/min')
+
+    def run(self, channel_ids):
+        done = read_checkpoint(self.checkpoint_path)
+        pending = [channel_id for channel_id in channel_ids if channel_id not in done]
+        print(f'{len(done)} channels already done, {len(pending)} to go')
+
+        start = time.perf_counter()
+        remaining = iter(pending)
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.threads) as threads, \
+                ProcessPoolExecutor(max_workers=self.processes,
+                                    mp_context=multiprocessing.get_context('spawn')) as processes:
+
+            def submit_fetches():
+                # Keep a bounded number of channels in flight so memory stays flat
+                while len(futures) < self.max_in_flight:
+                    channel_id = next(remaining, None)
+                    if channel_id is None:
+                        return
+                    futures[threads.submit(fetch_channel_data, channel_id)] = ('fetch', channel_id, None)
+
+            submit_fetches()
+            while futures:
+                finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, channel_id, payload = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._write_error(channel_id, stage, e)
+                        continue
+
+                    if stage == 'fetch':
+                        try:
+                            record = summarize_channel(channel_id, result)
+                        except Exception as e:
+                            self._write_error(channel_id, 'summarize', e)
+                            continue
+                        videos = result['all_video_details']
+                        if self.recommend and len(videos):
+                            future = threads.submit(get_recommendations, videos, result['tag_index'], self.refresh,
+                                                    partial(select_in_process, processes), True)
+                            futures[future] = ('recommend', channel_id, (record, videos))
+                        else:
+                            self._write_result(record, videos)
+                    else:
+                        record, videos = payload
+                        record['recommendation'] = result
+                        self._write_result(record, videos)
+
+                    if (self.completed + self.failed) % 10 == 0:
+                        self._report(start, len(pending))
+                submit_fetches()
+
+        self._report(start, len(pending))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse many YouTube channels without the Streamlit UI.')
+    parser.add_argument('channels', help='File with one channel ID per line')
+    parser.add_argument('--output', default='batch_output', help='Directory for results and the checkpoint')
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default='jsonl',
+                        help='parquet also writes the video table of each channel to videos/<id>.parquet')
+    parser.add_argument('--recommend', action='store_true', help='Also generate content recommendations')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Generate recommendations again instead of reusing cached ones')
+    parser.add_argument('--threads', type=int, default=8, help='Threads fetching channel data')
+    parser.add_argument('--processes', type=int, default=2, help='Processes clustering representative videos')
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(args.output, args.format, args.recommend, args.threads, args.processes,
+                         refresh=args.refresh)
+    runner.run(read_channel_ids(args.channels))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from constants import MAX_BATCH_SIZE, MAX_BATCH_WAIT
+
+
+# Marks the end of a streamed generation in its chunk queue
+_END = object()
+
+
+class _Request:
+    def __init__(self, prompt, max_new_tokens, stream=False):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.chunks = queue.Queue() if stream else None
+        self.cancelled = False
+
+
+class InferenceWorker:
+    """
+        Groups prompts submitted by concurrent callers into dynamic batches for one backend.
+
+        A batch is dispatched once it holds max_batch_size prompts or max_wait seconds after its
+        first prompt arrived, whichever comes first. Each caller gets its own result back.
+        Streamed generations run on the same thread one at a time, between batches, so the
+        backend is never driven by two callers at once.
+
+        Parameters:
+        - backend: Any backend from generation.py, it must implement generate_batch().
+        - max_batch_size (int): Upper bound on prompts per backend call.
+        - max_wait (float): Seconds to wait for more prompts before dispatching a partial batch.
+    """
+
+    def __init__(self, backend, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batch_sizes = Counter()
+        self.requests_served = 0
+        self.streams_served = 0
+        self.total_queue_wait = 0.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='inference-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, max_new_tokens):
+        if self._stopped.is_set():
+            raise RuntimeError('The inference worker has been stopped')
+        request = _Request(prompt, max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, prompt, max_new_tokens, timeout=None):
+        return self.submit(prompt, max_new_tokens).result(timeout=timeout)
+
+    def stream(self, prompt, max_new_tokens):
+        # Yields the chunks of one generation as the worker produces them, backend errors are re-raised
+        if self._stopped.is_set():
+            raise RuntimeError('The inference worker has been stopped')
+        request = _Request(prompt, max_new_tokens, stream=True)
+        self._queue.put(request)
+        try:
+            while True:
+                chunk = request.chunks.get()
+                if chunk is _END:
+                    break
+                yield chunk
+        finally:
+            # A consumer that stops reading, e.g. a disconnected client, frees the worker early
+            request.cancelled = True
+        request.future.result()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            streams = [request for request in batch if request.chunks is not None]
+            batch = [request for request in batch if request.chunks is None]
+            if batch:
+                self._run_batch(batch)
+            for request in streams:
+                self._run_stream(request)
+
+    def _run_batch(self, batch):
+        dispatched_at = time.perf_counter()
+        try:
+            # Each prompt asks for its own cap, the batch runs until the largest one.
+            results = self.backend.generate_batch([request.prompt for request in batch],
+                                                  max(request.max_new_tokens for request in batch))
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+            self.requests_served += len(batch)
+            self.total_queue_wait += sum(dispatched_at - request.enqueued_at for request in batch)
+
+    def _run_stream(self, request):
+        dispatched_at = time.perf_counter()
+        try:
+            chunks = self.backend.stream(request.prompt, request.max_new_tokens)
+            for chunk in chunks:
+                if request.cancelled:
+                    chunks.close()
+                    break
+                request.chunks.put(chunk)
+            request.future.set_result(None)
+        except Exception as e:
+            request.future.set_exception(e)
+        finally:
+            request.chunks.put(_END)
+
+        with self._lock:
+            self.streams_served += 1
+            self.requests_served += 1
+            self.total_queue_wait += dispatched_at - request.enqueued_at
+
+    def metrics(self):
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': batches,
+                'requests_served': self.requests_served,
+                'streams_served': self.streams_served,
+                'mean_batch_size': (self.requests_served - self.streams_served) / batches if batches else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'mean_queue_wait': self.total_queue_wait / self.requests_served if self.requests_served else 0.0,
+            }
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError('The inference worker has been stopped'))
+                if request.chunks is not None:
+                    request.chunks.put(_END)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_inference_worker(backend_loader):
+    # One worker per process, so every Streamlit session shares the same queue.
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = InferenceWorker(backend_loader())
+    return _worker
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+    Offline end-to-end benchmark of the recommendation pipeline.
+
+    YouTube API calls are answered by fixture_server.py (recorded fixtures first, synthetic
+    channels otherwise) and the models are replaced by stubs, or by small real models with
+    --models small. The production pipeline is run under a trace and every stage is read from
+    the span of the function implementing it, reported as p50/p95 latency plus the peak
+    Python memory allocated by the stage.
+
+    Example:
+        python benchmark.py --sizes 50 1000 20000 --repeat 5 --output bench.json
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+# Benchmark stage -> span recorded by the production function that implements it
+STAGES = {
+    'channel_fetch': 'get_channel_info',
+    'video_fetch': 'get_channel_videos',
+    'playlist_paging': 'playlist_paging',
+    'statistics': 'video_statistics',
+    'snapshots': 'snapshots.append',
+    'growth': 'growth',
+    'tag_index': 'tag_index.add',
+    'aggregation': 'aggregate',
+    'descriptions': 'load_descriptions',
+    'category_lookup': 'get_category',
+    'embedding': 'encode_texts',
+    'similar_video_search': 'get_best_similar_video',
+    'clustering': 'select_representatives',
+    'summarization': 'get_summarized',
+    'prompt_assembly': 'build_video_description',
+    'generation': 'inference',
+    'post_processing': 'postprocess_model_output',
+}
+
+def configure_environment(base_url, cache_dir, model_size='stub'):
+    # Must run before any module that reads constants.py is imported
+    os.environ['YOUTUBE_API_BASE_URL'] = base_url
+    os.environ.setdefault('PYTRENDS_API_KEY', 'benchmark-key')
+    os.environ['YOUTUBE_CACHE_PATH'] = os.path.join(cache_dir, 'youtube_cache.sqlite3')
+    os.environ['CONTENT_CACHE_DIR'] = os.path.join(cache_dir, 'content')
+    os.environ['VECTOR_INDEX_PATH'] = os.path.join(cache_dir, 'video_index.npz')
+    os.environ['SNAPSHOT_DIR'] = os.path.join(cache_dir, 'snapshots')
+    os.environ['RECOMMENDATION_CACHE_PATH'] = os.path.join(cache_dir, 'recommendations.sqlite3')
+    os.environ['YOUTUBE_DAILY_QUOTA'] = str(10 ** 9)
+    os.environ['INFERENCE_BATCHING'] = ''
+    if model_size == 'small':
+        # tiny-gpt2 has 1024 positions, the prompt is trimmed to leave room for the new tokens
+        os.environ['GENERATION_CONTEXT_LENGTH'] = '1024'
+        os.environ['MAX_NEW_TOKENS'] = '64'
+
+
+def register_small_models():
+    import models
+
+    # Real but small models, close enough in shape to the production ones to expose regressions
+    def summarizer():
+        from transformers import pipeline
+        return pipeline('summarization', model='sshleifer/distilbart-xsum-1-1', device='cpu')
+
+    def tokenizer():
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained('sshleifer/tiny-gpt2')
+
+    def token_counter():
+        tokenizer = models.get_tokenizer()
+        return lambda texts: [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
+    def generator():
+        from generation import TransformersBackend
+        return TransformersBackend('sshleifer/tiny-gpt2', models.get_tokenizer())
+
+    models.register('summarizer', summarizer)
+    models.register('tokenizer', tokenizer)
+    models.register('token_counter', token_counter)
+    models.register('generator', generator)
+
+
+def run_pipeline(channel_id):
+    """
+        Run the production pipeline once under a trace.
+
+        Returns:
+        - stages (dict): Seconds and peak memory per stage, summed over every call of the stage's
+          function. Stages are inclusive, e.g. embedding also counts the calls made by the similar video search.
+          Statistics pages are fetched concurrently, so that stage sums the time of every request and can
+          exceed the video fetch it is part of.
+    """
+    import pipeline
+    from tracing import trace_request
+    from utility import postprocess_model_output
+
+    with trace_request('benchmark') as trace:
+        data = pipeline.fetch_channel_data(channel_id)
+        output = pipeline.get_recommendations(data['all_video_details'], data['tag_index'])
+        if output is None:
+            raise RuntimeError(f'Generation failed for {channel_id}, the run would not time a full pipeline')
+        postprocess_model_output(output)
+
+    stages = {}
+    for name, span_name in STAGES.items():
+        spans = [span for span in trace.spans if span.name == span_name]
+        if spans:
+            stages[name] = {'seconds': sum(span.duration for span in spans),
+                            'peak_memory': max(span.peak_memory or 0 for span in spans)}
+    return stages
+
+
+def reset_caches():
+    from cache import metadata_cache
+    from categories import category_registry
+    from content_cache import content_cache
+    from recommendation_cache import recommendation_cache
+    from vector_index import video_index
+
+    metadata_cache.clear()
+    category_registry.clear()
+    content_cache.clear()
+    recommendation_cache.clear()
+    video_index.clear()
+
+
+def benchmark_size(size, repeat, warm):
+    channel_id = f'bench-{size}'
+    timings = defaultdict(list)
+
+    for i in range(repeat):
+        if not warm or i == 0:
+            reset_caches()
+        for name, stage in run_pipeline(channel_id).items():
+            timings[name].append(stage['seconds'])
+
+    # Memory is measured on a separate run so tracing does not distort the latencies
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    memory = run_pipeline(channel_id)
+    tracemalloc.stop()
+
+    return {
+        name: {
+            'p50_ms': float(np.percentile(timings[name], 50) * 1000),
+            'p95_ms': float(np.percentile(timings[name], 95) * 1000),
+            'peak_mb': memory.get(name, {}).get('peak_memory', 0) / 2 ** 20,
+        }
+        for name in STAGES if name in timings
+    }
+
+
+def print_report(results):
+    for size, stages in results.items():
+        print(f'\n{size} videos')
+        print(f"{'stage':<22}{'p50 ms':>12}{'p95 ms':>12}{'peak MB':>12}")
+        for name, row in stages.items():
+            print(f"{name:<22}{row['p50_ms']:>12.1f}{row['p95_ms']:>12.1f}{row['peak_mb']:>12.1f}")
+    print(f'\nmax RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline offline against a fixture server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 1000, 20000], help='Videos per synthetic channel')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per channel size')
+    parser.add_argument('--models', choices=('stub', 'small'), default='stub')
+    parser.add_argument('--fixtures', default=None, help='Directory of recorded API responses to replay')
+    parser.add_argument('--warm', action='store_true', help='Keep caches between runs instead of starting cold')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    cache_dir = tempfile.mkdtemp(prefix='bench-cache-')
+    # The server is started first so its port is known before constants.py reads the environment
+    from fixture_server import start_server
+    server = start_server(fixtures_dir=args.fixtures)
+    configure_environment(f'http://127.0.0.1:{server.server_port}', cache_dir, args.models)
+
+    from stub_models import register_stub_models
+    register_stub_models()
+    if args.models == 'small':
+        register_small_models()
+
+    results = {size: benchmark_size(size, args.repeat, args.warm) for size in args.sizes}
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
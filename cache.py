@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from constants import CACHE_PATH, CACHE_TTLS, CACHE_MAX_ENTRIES
+
+
+class MetadataCache:
+    """
+        Persistent SQLite cache for YouTube API responses with per-kind TTLs and LRU eviction.
+
+        Parameters:
+        - path (str): Location of the SQLite database file.
+        - ttls (dict): Seconds an entry of each kind stays fresh, e.g. {'video': 21600}.
+        - max_entries (int): Least recently used entries are evicted beyond this size.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttls=CACHE_TTLS, max_entries=CACHE_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+            kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+            fetched_at REAL NOT NULL, accessed_at REAL NOT NULL,
+            PRIMARY KEY (kind, key))''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+        self._conn.commit()
+
+    def _is_fresh(self, kind, fetched_at, now):
+        return now - fetched_at < self.ttls.get(kind, self.ttls['default'])
+
+    def get_entry(self, kind, key):
+        # Returns (value, is_fresh); stale values are still returned for incremental refreshes.
+        entries = self.get_many_entries(kind, [key])
+        return entries.get(key, (None, False))
+
+    def get(self, kind, key):
+        value, fresh = self.get_entry(kind, key)
+        return value if fresh else None
+
+    def get_many_entries(self, kind, keys):
+        keys = list(keys)
+        now = time.time()
+        entries = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f'SELECT key, value, fetched_at FROM entries WHERE kind = ? AND key IN ({",".join("?" * len(batch))})',
+                    [kind, *batch]).fetchall()
+                for key, value, fetched_at in rows:
+                    entries[key] = (json.loads(value), self._is_fresh(kind, fetched_at, now))
+
+            if entries:
+                self._conn.executemany('UPDATE entries SET accessed_at = ? WHERE kind = ? AND key = ?',
+                                       [(now, kind, key) for key in entries])
+                self._conn.commit()
+
+            fresh = sum(1 for _, is_fresh in entries.values() if is_fresh)
+            self.counters['hits'] += fresh
+            self.counters['stale'] += len(entries) - fresh
+            self.counters['misses'] += len(keys) - len(entries)
+        return entries
+
+    def get_many(self, kind, keys):
+        return {key: value for key, (value, fresh) in self.get_many_entries(kind, keys).items() if fresh}
+
+    def set(self, kind, key, value):
+        self.set_many(kind, {key: value})
+
+    def set_many(self, kind, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO entries (kind, key, value, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                [(kind, key, json.dumps(value), now, now) for key, value in items.items()])
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed_at LIMIT ?)',
+                (count - self.max_entries,))
+
+    def stats(self):
+        return dict(self.counters)
+
+    def clear(self, kind=None):
+        with self._lock:
+            if kind is None:
+                self._conn.execute('DELETE FROM entries')
+            else:
+                self._conn.execute('DELETE FROM entries WHERE kind = ?', (kind,))
+            self._conn.commit()
+
+
+metadata_cache = MetadataCache()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from api_client import api_get
+from cache import metadata_cache
+from constants import CATEGORY_REGION, CATEGORY_RETRY_INTERVAL, CACHE_TTLS
+
+
+class CategoryRegistry:
+    """
+        In-memory table of YouTube video category titles, loaded once per region.
+
+        The table is persisted in the metadata cache under the 'categories' kind and refetched
+        after its TTL; when the refetch fails the previous table is kept and the region is
+        requested again after retry_interval. Concurrent callers wait for one in-flight fetch
+        instead of issuing their own.
+
+        Parameters:
+        - region_code (str): ISO 3166-1 alpha-2 region the category list is requested for.
+        - ttl (float): Seconds before the in-memory table is checked against the cache again.
+        - retry_interval (float): Seconds before a failed region fetch is tried again.
+    """
+
+    def __init__(self, region_code=CATEGORY_REGION, ttl=CACHE_TTLS['categories'],
+                 retry_interval=CATEGORY_RETRY_INTERVAL):
+        self.region_code = region_code
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._titles = {}
+        self._unknown = set()
+        # Set only while the table holds a fresh region list, from the API or the cache
+        self._loaded_at = None
+        self._retry_at = None
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        now = time.time()
+        if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+            return True
+        return self._retry_at is not None and now < self._retry_at
+
+    def load(self):
+        if self._fresh():
+            return self._titles
+
+        with self._lock:
+            if self._fresh():
+                return self._titles
+
+            titles, fresh = metadata_cache.get_entry('categories', self.region_code)
+            if not fresh:
+                try:
+                    response = api_get('videoCategories', {'part': 'snippet', 'regionCode': self.region_code})
+                    titles = {item['id']: item['snippet']['title'] for item in response.get('items', [])}
+                    metadata_cache.set('categories', self.region_code, titles)
+                    fresh = True
+                except Exception as e:
+                    print('An error occurred while fetching video categories:', e)
+
+            self._titles = titles or self._titles
+            if fresh:
+                self._loaded_at, self._retry_at = time.time(), None
+            else:
+                # A stale or empty table is used for now, the region is requested again soon
+                self._loaded_at, self._retry_at = None, time.time() + self.retry_interval
+            return self._titles
+
+    def _fetch_missing(self, category_ids):
+        # Categories that are not listed for the region are looked up by ID and kept in the table
+        with self._lock:
+            missing_ids = [category_id for category_id in category_ids
+                           if category_id not in self._titles and category_id not in self._unknown]
+            if not missing_ids:
+                return
+            try:
+                response = api_get('videoCategories', {'part': 'snippet', 'id': ','.join(missing_ids)})
+            except Exception as e:
+                print('An error occurred while fetching video categories:', e)
+                return
+            titles = dict(self._titles)
+            titles.update({item['id']: item['snippet']['title'] for item in response.get('items', [])})
+            # IDs the API does not know are not asked for again until the table is cleared
+            self._unknown.update(category_id for category_id in missing_ids if category_id not in titles)
+            # Without a fresh region list the table is partial and must not be cached as fresh
+            if self._loaded_at is not None:
+                metadata_cache.set('categories', self.region_code, titles)
+            self._titles = titles
+
+    def titles(self, category_ids):
+        category_ids = [category_id for category_id in category_ids if category_id is not None]
+        titles = self.load()
+        if any(category_id not in titles and category_id not in self._unknown for category_id in category_ids):
+            self._fetch_missing(category_ids)
+            titles = self._titles
+        return {category_id: titles[category_id] for category_id in category_ids if category_id in titles}
+
+    def clear(self):
+        with self._lock:
+            self._titles = {}
+            self._unknown = set()
+            self._loaded_at = None
+            self._retry_at = None
+
+
+category_registry = CategoryRegistry()
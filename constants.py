@@ -1,10 +1,111 @@
+import os
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 API_KEY = os.getenv('PYTRENDS_API_KEY')
 
-BASE_URL = 'https://www.googleapis.com/youtube/v3'
+# Point this at a local stub server to run the pipeline without live YouTube access.
+BASE_URL = os.getenv('YOUTUBE_API_BASE_URL', 'https://www.googleapis.com/youtube/v3')
 
 # Add more if you have more than 1 API_KEY.
-APIS = [API_KEY]
\ No newline at end of file
+APIS = [API_KEY]
+
+# HTTP client settings shared by every YouTube Data API call.
+REQUEST_TIMEOUT = float(os.getenv('YOUTUBE_API_TIMEOUT', '15'))
+HTTP_POOL_SIZE = int(os.getenv('YOUTUBE_API_POOL_SIZE', '16'))
+MAX_API_WORKERS = int(os.getenv('YOUTUBE_API_WORKERS', '8'))
+# Save every response under this directory so fixture_server.py can replay it.
+API_RECORD_DIR = os.getenv('YOUTUBE_API_RECORD_DIR', '')
+
+# Quota units charged per endpoint, see https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {'search': 100, 'default': 1}
+DAILY_QUOTA = int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000'))
+
+# 'round_robin' or 'least_used'
+KEY_STRATEGY = os.getenv('YOUTUBE_KEY_STRATEGY', 'round_robin')
+MAX_API_RETRIES = int(os.getenv('YOUTUBE_API_RETRIES', '4'))
+
+# Persistent cache for channel, playlist, video and category responses.
+CACHE_PATH = os.getenv('YOUTUBE_CACHE_PATH', os.path.join('.cache', 'youtube_cache.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.getenv('YOUTUBE_CACHE_MAX_ENTRIES', '200000'))
+# Seconds before a cached entry of each kind is considered stale.
+CACHE_TTLS = {
+    'channel': 6 * 60 * 60,
+    'playlist': 60 * 60,
+    'video': 6 * 60 * 60,
+    'categories': 30 * 24 * 60 * 60,
+    'default': 24 * 60 * 60,
+}
+
+# Ceiling for the video table of one channel; past it only the most recent uploads are kept. 0 disables it.
+MEMORY_LIMIT_MB = float(os.getenv('MEMORY_LIMIT_MB', '0'))
+
+# Append-only per-video statistics history, see snapshots.py
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join('.cache', 'snapshots'))
+# Channels whose decoded history stays in memory between fetches
+SNAPSHOT_CHANNELS = int(os.getenv('SNAPSHOT_CHANNELS', '64'))
+
+# Region the video category table is requested for, see categories.py
+CATEGORY_REGION = os.getenv('YOUTUBE_CATEGORY_REGION', 'US')
+# Seconds before the category table is requested again after a failed fetch
+CATEGORY_RETRY_INTERVAL = float(os.getenv('YOUTUBE_CATEGORY_RETRY_INTERVAL', '300'))
+
+# Number of texts passed through the summarizer per forward pass.
+SUMMARY_BATCH_SIZE = int(os.getenv('SUMMARY_BATCH_SIZE', '8'))
+
+# Content-addressed cache for summaries and embeddings.
+CONTENT_CACHE_DIR = os.getenv('CONTENT_CACHE_DIR', os.path.join('.cache', 'content'))
+CONTENT_CACHE_MEMORY_ITEMS = int(os.getenv('CONTENT_CACHE_MEMORY_ITEMS', '4096'))
+
+# Generation backend: 'transformers', 'llama_cpp' (CPU-quantized GGUF) or 'stub'.
+GENERATION_BACKEND = os.getenv('GENERATION_BACKEND', 'transformers')
+GENERATION_MODEL_ID = os.getenv('GENERATION_MODEL_ID', 'meta-llama/Meta-Llama-3.1-8B-Instruct')
+LLAMA_CPP_MODEL_PATH = os.getenv('LLAMA_CPP_MODEL_PATH', '')
+GENERATION_CONTEXT_LENGTH = int(os.getenv('GENERATION_CONTEXT_LENGTH', '8192'))
+MAX_NEW_TOKENS = int(os.getenv('MAX_NEW_TOKENS', '512'))
+# Seconds a streamed generation may go without producing a token before it is abandoned.
+GENERATION_STREAM_TIMEOUT = float(os.getenv('GENERATION_STREAM_TIMEOUT', '120'))
+# Summaries more similar than this to one already in the prompt are left out, see prompt_builder.py
+PROMPT_DEDUPE_THRESHOLD = float(os.getenv('PROMPT_DEDUPE_THRESHOLD', '0.92'))
+
+# Generated recommendations, reused while the model, prompt and video description stay the same.
+RECOMMENDATION_CACHE_PATH = os.getenv('RECOMMENDATION_CACHE_PATH', os.path.join('.cache', 'recommendations.sqlite3'))
+RECOMMENDATION_TTL = float(os.getenv('RECOMMENDATION_TTL', str(24 * 60 * 60)))
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv('RECOMMENDATION_CACHE_MAX_ENTRIES', '1000'))
+# Also reuse the answer for a description whose embedding is at least this similar, 0 only reuses exact matches.
+RECOMMENDATION_REUSE_THRESHOLD = float(os.getenv('RECOMMENDATION_REUSE_THRESHOLD', '0'))
+
+# Serve the models from one model_server.py process instead of loading them in every app process.
+MODEL_SERVER_URL = os.getenv('MODEL_SERVER_URL', '')
+MODEL_SERVER_TIMEOUT = float(os.getenv('MODEL_SERVER_TIMEOUT', '300'))
+
+# Group concurrent recommendation requests into batches on a shared inference worker.
+INFERENCE_BATCHING = os.getenv('INFERENCE_BATCHING', '').lower() in ('1', 'true', 'yes')
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '4'))
+MAX_BATCH_WAIT = float(os.getenv('MAX_BATCH_WAIT', '0.05'))
+
+# Representative video selection, see representatives.py
+TOP_VIDEOS = int(os.getenv('TOP_VIDEOS', '100'))
+NUM_REPRESENTATIVES = int(os.getenv('NUM_REPRESENTATIVES', '10'))
+# 'kmeans', 'minibatch', 'kcenter' or 'mmr'
+REPRESENTATIVE_METHOD = os.getenv('REPRESENTATIVE_METHOD', 'kmeans')
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', '0.5'))
+
+# Local index of similar videos, queried before the 100-unit search endpoint.
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', os.path.join('.cache', 'video_index.npz'))
+IVF_MIN_SIZE = int(os.getenv('IVF_MIN_SIZE', '20000'))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', '8'))
+SIMILAR_VIDEOS = int(os.getenv('SIMILAR_VIDEOS', '10'))
+SIMILAR_MIN_SCORE = float(os.getenv('SIMILAR_MIN_SCORE', '0.5'))
+SEARCH_TAGS = int(os.getenv('SEARCH_TAGS', '5'))
+
+# Per-channel tag vocabulary and video x tag matrix, see tag_index.py
+TAG_INDEX_CHANNELS = int(os.getenv('TAG_INDEX_CHANNELS', '256'))
+TAG_CLUSTER_THRESHOLD = float(os.getenv('TAG_CLUSTER_THRESHOLD', '0.3'))
+
+# Finished background jobs kept for sessions that attach to them later, see jobs.py
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', '32'))
+# Seconds between refreshes of the page while a background job is running
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '0.5'))
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from constants import CONTENT_CACHE_DIR, CONTENT_CACHE_MEMORY_ITEMS
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def content_key(text, model_id):
+    return hashlib.sha256(f'{model_id}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class ContentCache:
+    """
+        Summaries and embeddings keyed on a hash of the normalized text plus the model id.
+
+        A bounded in-memory LRU sits in front of two persistent tiers: summaries live in
+        SQLite and embeddings in one memory-mapped float32 matrix per model.
+
+        Parameters:
+        - directory (str): Where the SQLite database and embedding matrices are stored.
+        - memory_items (int): Size of each in-memory LRU tier.
+    """
+
+    def __init__(self, directory=CONTENT_CACHE_DIR, memory_items=CONTENT_CACHE_MEMORY_ITEMS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.summaries = LRUCache(memory_items)
+        self.embeddings = LRUCache(memory_items)
+        self.counters = Counter()
+        self._matrices = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'content.sqlite3'), timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL)')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY, model_id TEXT NOT NULL, row INTEGER NOT NULL)''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embedding_matrices (
+            model_id TEXT PRIMARY KEY, dim INTEGER NOT NULL, rows INTEGER NOT NULL)''')
+        self._conn.commit()
+
+    def _matrix_path(self, model_id):
+        return os.path.join(self.directory, hashlib.sha1(model_id.encode('utf-8')).hexdigest()[:16] + '.f32')
+
+    def _open_matrix(self, model_id, dim=None, min_rows=0):
+        # Returns (memmap, used_rows) and grows the backing file geometrically when needed.
+        row = self._conn.execute('SELECT dim, rows FROM embedding_matrices WHERE model_id = ?',
+                                 (model_id,)).fetchone()
+        if row is None:
+            if dim is None:
+                return None, 0
+            self._conn.execute('INSERT INTO embedding_matrices VALUES (?, ?, 0)', (model_id, dim))
+            row = (dim, 0)
+        dim, used_rows = row
+        # Another process may have appended rows since the matrix was mapped.
+        min_rows = max(min_rows, used_rows)
+
+        matrix = self._matrices.get(model_id)
+        if matrix is None or matrix.shape[0] < min_rows:
+            path = self._matrix_path(model_id)
+            capacity = os.path.getsize(path) // (4 * dim) if os.path.exists(path) else 0
+            if capacity < min_rows:
+                capacity = max(min_rows, 2 * capacity, 1024)
+                with open(path, 'ab') as f:
+                    f.truncate(capacity * dim * 4)
+            if capacity == 0:
+                return None, used_rows
+            matrix = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, dim))
+            self._matrices[model_id] = matrix
+        return matrix, used_rows
+
+    def get_summaries(self, texts, model_id):
+        # Returns the keys of every text and the summaries found in the cache, by position.
+        keys = [content_key(text, model_id) for text in texts]
+        found = {}
+        missing = {}
+        for i, key in enumerate(keys):
+            summary = self.summaries.get(key)
+            if summary is not None:
+                found[i] = summary
+                self.counters['summary_memory_hits'] += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            with self._lock:
+                rows = self._select('SELECT key, summary FROM summaries WHERE key IN ({})', list(missing))
+            for key, summary in rows:
+                self.summaries.set(key, summary)
+                for i in missing.pop(key):
+                    found[i] = summary
+                    self.counters['summary_disk_hits'] += 1
+
+        self.counters['summary_misses'] += sum(len(positions) for positions in missing.values())
+        return keys, found
+
+    def set_summaries(self, keys, summaries):
+        for key, summary in zip(keys, summaries):
+            self.summaries.set(key, summary)
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO summaries VALUES (?, ?)', list(zip(keys, summaries)))
+            self._conn.commit()
+
+    def get_embeddings(self, texts, model_id):
+        keys = [content_key(text, model_id) for text in texts]
+        found = {}
+        missing = {}
+        for i, key in enumerate(keys):
+            embedding = self.embeddings.get(key)
+            if embedding is not None:
+                found[i] = embedding
+                self.counters['embedding_memory_hits'] += 1
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            with self._lock:
+                rows = self._select('SELECT key, row FROM embeddings WHERE key IN ({})', list(missing))
+                matrix, _ = self._open_matrix(model_id)
+                for key, row in rows:
+                    embedding = np.array(matrix[row])
+                    self.embeddings.set(key, embedding)
+                    for i in missing.pop(key):
+                        found[i] = embedding
+                        self.counters['embedding_disk_hits'] += 1
+
+        self.counters['embedding_misses'] += sum(len(positions) for positions in missing.values())
+        return keys, found
+
+    def set_embeddings(self, keys, embeddings, model_id):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        for key, embedding in zip(keys, embeddings):
+            self.embeddings.set(key, embedding)
+
+        with self._lock:
+            # Rows are reserved under SQLite's write lock, so processes sharing the directory append in turn
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                known = {key for key, _ in self._select('SELECT key, row FROM embeddings WHERE key IN ({})',
+                                                        list(keys))}
+                new = [(key, embedding) for key, embedding in zip(keys, embeddings) if key not in known]
+                if not new:
+                    self._conn.rollback()
+                    return
+                _, used_rows = self._open_matrix(model_id, dim=embeddings.shape[1])
+                matrix, _ = self._open_matrix(model_id, min_rows=used_rows + len(new))
+                matrix[used_rows:used_rows + len(new)] = np.stack([embedding for _, embedding in new])
+                matrix.flush()
+                self._conn.executemany('INSERT INTO embeddings VALUES (?, ?, ?)',
+                                       [(key, model_id, used_rows + j) for j, (key, _) in enumerate(new)])
+                self._conn.execute('UPDATE embedding_matrices SET rows = ? WHERE model_id = ?',
+                                   (used_rows + len(new), model_id))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def _select(self, query, keys):
+        rows = []
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows.extend(self._conn.execute(query.format(','.join('?' * len(batch))), batch).fetchall())
+        return rows
+
+    def stats(self):
+        return dict(self.counters)
+
+    def clear(self):
+        self.summaries.clear()
+        self.embeddings.clear()
+        self.counters.clear()
+        with self._lock:
+            self._conn.execute('DELETE FROM summaries')
+            self._conn.execute('DELETE FROM embeddings')
+            self._conn.execute('UPDATE embedding_matrices SET rows = 0')
+            self._conn.commit()
+
+
+def cached_summaries(texts, model_id, summarize):
+    # summarize(list_of_texts) is only called for texts that are not cached yet.
+    texts = list(texts)
+    keys, found = content_cache.get_summaries(texts, model_id)
+    missing = {}
+    for i, key in enumerate(keys):
+        if i not in found:
+            missing.setdefault(key, i)
+
+    if missing:
+        summaries = summarize([texts[i] for i in missing.values()])
+        content_cache.set_summaries(list(missing), summaries)
+        by_key = dict(zip(missing, summaries))
+        for i, key in enumerate(keys):
+            found.setdefault(i, by_key.get(key))
+
+    return [found[i] for i in range(len(texts))]
+
+
+def cached_embeddings(texts, model_id, encode):
+    # encode(list_of_texts) is only called for texts that are not cached yet.
+    texts = list(texts)
+    keys, found = content_cache.get_embeddings(texts, model_id)
+    missing = {}
+    for i, key in enumerate(keys):
+        if i not in found:
+            missing.setdefault(key, i)
+
+    if missing:
+        embeddings = np.asarray(encode([texts[i] for i in missing.values()]), dtype=np.float32)
+        content_cache.set_embeddings(list(missing), embeddings, model_id)
+        by_key = dict(zip(missing, embeddings))
+        for i, key in enumerate(keys):
+            found.setdefault(i, by_key.get(key))
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[i] for i in range(len(texts))])
+
+
+content_cache = ContentCache()
\ No newline at end of file
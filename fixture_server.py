@@ -0,0 +1,162 @@
+"""
+    Local stand-in for the YouTube Data API used by benchmarks and offline runs.
+
+    Requests are answered from recorded responses when a matching fixture exists (see
+    YOUTUBE_API_RECORD_DIR in api_client.py) and from a deterministic synthetic channel
+    otherwise. Synthetic channel IDs encode their size: 'bench-1000' has 1000 uploads.
+
+    Example:
+        python fixture_server.py --port 8765 --fixtures fixtures/
+        YOUTUBE_API_BASE_URL=http://127.0.0.1:8765 streamlit run main.py
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WORDS = ('music', 'guitar', 'lesson', 'cover', 'live', 'tutorial', 'review', 'vlog', 'travel', 'food',
+         'recipe', 'gaming', 'speedrun', 'science', 'history', 'explained', 'daily', 'challenge',
+         'beginner', 'advanced', 'tips', 'tricks', 'budget', 'setup', 'studio', 'behind', 'scenes')
+CATEGORIES = {'1': 'Film & Animation', '10': 'Music', '20': 'Gaming', '22': 'People & Blogs',
+              '24': 'Entertainment', '26': 'Howto & Style', '27': 'Education', '28': 'Science & Technology'}
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _rng(*parts):
+    return random.Random(zlib.crc32('/'.join(map(str, parts)).encode('utf-8')))
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def synthetic_video(video_id):
+    rng = _rng('video', video_id)
+    published = EPOCH - timedelta(seconds=rng.randint(0, 5 * 365 * 24 * 3600))
+    snippet = {
+        'title': _sentence(rng, rng.randint(3, 8)).title(),
+        'description': '. '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(1, 12))),
+        'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'categoryId': rng.choice(list(CATEGORIES)),
+        'tags': sorted({rng.choice(WORDS) for _ in range(rng.randint(0, 10))}),
+        'defaultAudioLanguage': rng.choice(['en', 'en-US', 'fr', 'de']),
+    }
+    if rng.random() < 0.7:
+        snippet['defaultLanguage'] = 'en'
+    views = int(rng.paretovariate(1.2) * 1000)
+    statistics = {'viewCount': str(views), 'commentCount': str(views // rng.randint(50, 500))}
+    if rng.random() < 0.9:
+        statistics['likeCount'] = str(views // rng.randint(10, 60))
+    return {'id': video_id, 'snippet': snippet, 'statistics': statistics}
+
+
+def _channel_size(channel_id):
+    try:
+        return int(channel_id.rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return 50
+
+
+def synthetic_response(endpoint, params):
+    if endpoint == 'channels':
+        channel_id = params['id']
+        return {'items': [{
+            'id': channel_id,
+            'snippet': {'title': f'Benchmark channel {channel_id}', 'publishedAt': '2015-06-01T00:00:00Z',
+                        'country': 'US', 'thumbnails': {'medium': {'url': 'https://example.com/thumb.jpg'}}},
+            'contentDetails': {'relatedPlaylists': {'uploads': f'UU{channel_id}'}},
+            'statistics': {'subscriberCount': '12345', 'viewCount': '67890',
+                           'videoCount': str(_channel_size(channel_id))},
+        }]}
+
+    if endpoint == 'playlistItems':
+        channel_id = params['playlistId'][2:]
+        size = _channel_size(channel_id)
+        page_size = int(params.get('maxResults', 50))
+        start = int(params.get('pageToken', 0))
+        items = [{'contentDetails': {'videoId': f'{channel_id}-{i:06d}'}}
+                 for i in range(start, min(start + page_size, size))]
+        response = {'items': items}
+        if start + page_size < size:
+            response['nextPageToken'] = str(start + page_size)
+        return response
+
+    if endpoint == 'videos':
+        return {'items': [synthetic_video(video_id) for video_id in params['id'].split(',') if video_id]}
+
+    if endpoint == 'videoCategories':
+        ids = params['id'].split(',') if params.get('id') else list(CATEGORIES)
+        return {'items': [{'id': category_id, 'snippet': {'title': CATEGORIES[category_id]}}
+                          for category_id in ids if category_id in CATEGORIES]}
+
+    if endpoint == 'search':
+        rng = _rng('search', params.get('q'), params.get('videoCategoryId'))
+        return {'items': [{'id': {'videoId': f"similar-{params.get('videoCategoryId')}-{rng.randint(0, 10 ** 6)}"},
+                           'snippet': {'publishedAt': EPOCH.strftime('%Y-%m-%dT%H:%M:%SZ')}}
+                          for _ in range(int(params.get('maxResults', 10)))]}
+
+    return None
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the pooled client session reuses its connections like against the real API
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    fixtures_dir = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items() if key != 'key'}
+
+        response = None
+        if self.fixtures_dir:
+            from api_client import fixture_key
+
+            path = os.path.join(self.fixtures_dir, endpoint, fixture_key(endpoint, params) + '.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    response = json.load(f)
+        if response is None:
+            response = synthetic_response(endpoint, params)
+
+        if response is None:
+            body = json.dumps({'error': {'message': f'Unknown endpoint {endpoint}',
+                                         'errors': [{'reason': 'notFound'}]}}).encode('utf-8')
+            self.send_response(404)
+        else:
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, fixtures_dir=None):
+    # Returns the running server; its base URL is http://127.0.0.1:<server.server_port>
+    handler = type('Handler', (FixtureHandler,), {'fixtures_dir': fixtures_dir})
+    server_class = type('Server', (ThreadingHTTPServer,), {'request_queue_size': 128})
+    server = server_class(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fixture-server', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded or synthetic YouTube Data API responses.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=None, help='Directory of recorded responses')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.fixtures)
+    print(f'Serving on http://127.0.0.1:{server.server_port}')
+    threading.Event().wait()
\ No newline at end of file
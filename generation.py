@@ -0,0 +1,228 @@
+import copy
+import threading
+import time
+
+from constants import GENERATION_CONTEXT_LENGTH, GENERATION_STREAM_TIMEOUT
+from tracing import record, record_span
+
+
+class GenerationStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end = None
+        self.tokens = 0
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    @property
+    def total_time(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.end is None or self.end <= self.first_token_at:
+            return None
+        return self.tokens / (self.end - self.first_token_at)
+
+    def as_dict(self):
+        return {
+            'time_to_first_token': self.time_to_first_token,
+            'total_time': self.total_time,
+            'tokens': self.tokens,
+            'tokens_per_second': self.tokens_per_second,
+        }
+
+
+class GenerationStream:
+    """
+        Iterates over the text chunks produced by a backend and measures the generation.
+
+        The stream can be passed straight to st.write_stream; stats are complete once it is exhausted.
+    """
+
+    def __init__(self, backend, prompt, max_new_tokens):
+        self.backend = backend
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.stats = GenerationStats()
+        self.text = ''
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self.backend.stream(self.prompt, self.max_new_tokens):
+            if chunk and self.stats.first_token_at is None:
+                self.stats.first_token_at = time.perf_counter()
+            chunks.append(chunk)
+            yield chunk
+
+        self.stats.end = time.perf_counter()
+        self.text = ''.join(chunks)
+        self.stats.tokens = self.backend.count_tokens(self.text)
+        record_span('model.generate', self.stats.start, self.stats.end)
+        record('generated_tokens', self.stats.tokens)
+        record('prompt_tokens', self.backend.count_tokens(self.prompt))
+
+
+class TransformersBackend:
+    """Hugging Face causal LM; 8-bit on GPU when bitsandbytes is installed, full precision on CPU."""
+
+    def __init__(self, model_id, tokenizer):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        self.tokenizer = tokenizer
+        if torch.cuda.is_available():
+            kwargs = {'device_map': 'auto', 'torch_dtype': torch.float16}
+            try:
+                import bitsandbytes  # noqa: F401
+                from transformers import BitsAndBytesConfig
+
+                kwargs['quantization_config'] = BitsAndBytesConfig(load_in_8bit=True)
+            except ImportError:
+                pass
+        else:
+            kwargs = {'torch_dtype': torch.float32}
+        # Safetensors weights are memory-mapped instead of being copied through a second buffer
+        kwargs['low_cpu_mem_usage'] = True
+
+        self.model = AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
+        self._prefix = None
+        self._prefix_ids = None
+        self._prefix_cache = None
+
+        torch.backends.cuda.enable_mem_efficient_sdp(False)
+        torch.backends.cuda.enable_flash_sdp(False)
+
+    def cache_prefix(self, prefix):
+        # KV cache of the static start of every prompt, computed once and copied into each generation
+        if prefix == self._prefix:
+            return
+        import torch
+        from transformers import DynamicCache
+
+        ids = self.tokenizer(prefix, return_tensors='pt')['input_ids'].to(self.model.device)
+        with torch.no_grad():
+            cache = self.model(input_ids=ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        self._prefix, self._prefix_ids, self._prefix_cache = prefix, ids, cache
+
+    def _inputs(self, prompt):
+        import torch
+
+        if self._prefix is None or not prompt.startswith(self._prefix):
+            return dict(self.tokenizer(prompt, return_tensors='pt').to(self.model.device))
+
+        # The prefix is tokenized on its own so its ids match the cached keys and values
+        rest = self.tokenizer(prompt[len(self._prefix):], return_tensors='pt',
+                              add_special_tokens=False)['input_ids'].to(self.model.device)
+        input_ids = torch.cat([self._prefix_ids, rest], dim=1)
+        return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids),
+                'past_key_values': copy.deepcopy(self._prefix_cache)}
+
+    def stream(self, prompt, max_new_tokens):
+        from transformers import TextIteratorStreamer
+
+        inputs = self._inputs(prompt)
+        # A stalled generation raises queue.Empty instead of blocking the consumer forever
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=GENERATION_STREAM_TIMEOUT)
+        errors = []
+
+        def generate():
+            try:
+                self.model.generate(**inputs, streamer=streamer, max_new_tokens=max_new_tokens,
+                                    pad_token_id=self.tokenizer.eos_token_id)
+            except Exception as e:
+                errors.append(e)
+                # Ends the iteration below, the error is raised once the queue is drained
+                streamer.end()
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            thread.join(GENERATION_STREAM_TIMEOUT)
+        if errors:
+            raise errors[0]
+
+    def generate_batch(self, prompts, max_new_tokens):
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Decoder-only models need left padding so every prompt ends right before its continuation
+        self.tokenizer.padding_side = 'left'
+
+        inputs = self.tokenizer(prompts, return_tensors='pt', padding=True).to(self.model.device)
+        outputs = self.model.generate(**inputs, max_new_tokens=max_new_tokens,
+                                      pad_token_id=self.tokenizer.pad_token_id)
+        return self.tokenizer.batch_decode(outputs[:, inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+class LlamaCppBackend:
+    """CPU-quantized runtime: runs a GGUF export of the model through llama-cpp-python."""
+
+    def __init__(self, model_path, n_ctx=GENERATION_CONTEXT_LENGTH, n_threads=None):
+        from llama_cpp import Llama
+
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        self._prefix = None
+
+    def cache_prefix(self, prefix):
+        # llama.cpp reuses evaluated state for the longest matching token prefix, kept in a RAM cache
+        if prefix == self._prefix:
+            return
+        from llama_cpp import LlamaRAMCache
+
+        tokens = self.llm.tokenize(prefix.encode('utf-8'))
+        self.llm.set_cache(LlamaRAMCache())
+        self.llm.reset()
+        self.llm.eval(tokens)
+        self.llm.cache[tokens] = self.llm.save_state()
+        self._prefix = prefix
+
+    def stream(self, prompt, max_new_tokens):
+        for chunk in self.llm(prompt, max_tokens=max_new_tokens, stream=True):
+            yield chunk['choices'][0]['text']
+
+    def generate_batch(self, prompts, max_new_tokens):
+        # llama-cpp-python evaluates one sequence at a time
+        return [self.llm(prompt, max_tokens=max_new_tokens)['choices'][0]['text'] for prompt in prompts]
+
+    def count_tokens(self, text):
+        return len(self.llm.tokenize(text.encode('utf-8'), add_bos=False))
+
+
+class StubBackend:
+    """Dependency free backend for tests and benchmarks; streams a canned answer word by word."""
+
+    def __init__(self, response=None, delay=0.0):
+        self.response = response or '1. Behind the scenes of a typical week on the channel.'
+        self.delay = delay
+
+    def cache_prefix(self, prefix):
+        pass
+
+    def stream(self, prompt, max_new_tokens):
+        for word in self.response.split(' ')[:max_new_tokens]:
+            if self.delay:
+                time.sleep(self.delay)
+            yield word + ' '
+
+    def generate_batch(self, prompts, max_new_tokens):
+        if self.delay:
+            time.sleep(self.delay)
+        return [' '.join(self.response.split(' ')[:max_new_tokens]) for _ in prompts]
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+def generate_stream(backend, prompt, max_new_tokens):
+    return GenerationStream(backend, prompt, max_new_tokens)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from constants import JOB_HISTORY
+
+
+class Job:
+    """
+        A pipeline run on a background thread, shared by every Streamlit rerun and session that asks for it.
+
+        The function is called as fn(job, *args) and can publish partial results with job.update(),
+        which readers pick up with job.snapshot() while the job is still running.
+
+        Parameters:
+        - key (tuple): Identifies the work, e.g. ('recommendations', channel_id).
+        - fn (callable): The work to run.
+        - args (tuple): Extra arguments for fn.
+    """
+
+    def __init__(self, key, fn, args):
+        self.key = key
+        self.result = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._state = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(fn, args), name=f'job-{key[0]}', daemon=True)
+
+    def _run(self, fn, args):
+        try:
+            self.result = fn(self, *args)
+        except Exception as e:
+            print(f'Job {self.key} failed: {e}')
+            self.error = e
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def update(self, **values):
+        with self._lock:
+            self._state.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._state)
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def submit(key, fn, *args):
+    # A job with the same key that is still running is returned instead of starting a duplicate
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and not job.done:
+            return job
+
+        job = Job(key, fn, args)
+        _jobs[key] = job
+        _jobs.move_to_end(key)
+        finished = [k for k, j in _jobs.items() if j.done]
+        for k in finished[:max(len(finished) - JOB_HISTORY, 0)]:
+            del _jobs[k]
+        job._thread.start()
+        return job
+
+
+def get(key):
+    with _jobs_lock:
+        return _jobs.get(key)
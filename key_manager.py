@@ -0,0 +1,147 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from constants import APIS, QUOTA_COSTS, DAILY_QUOTA, KEY_STRATEGY
+
+# YouTube Data API quotas reset at midnight Pacific time.
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+
+def quota_cost(endpoint):
+    return QUOTA_COSTS.get(endpoint, QUOTA_COSTS['default'])
+
+
+def seconds_until_quota_reset(now=None):
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (reset - now).total_seconds()
+
+
+class RequestUsage:
+    def __init__(self):
+        self.units = 0
+        self.calls = 0
+        self.units_by_endpoint = defaultdict(int)
+        self.units_by_key = defaultdict(int)
+
+
+class KeyManager:
+    """
+        Hands out API keys according to the remaining quota of each key.
+
+        Parameters:
+        - keys (list): The API keys to rotate through.
+        - strategy (str): 'round_robin' or 'least_used'.
+        - daily_quota (int): Quota units available per key and day.
+    """
+
+    def __init__(self, keys, strategy=KEY_STRATEGY, daily_quota=DAILY_QUOTA):
+        self.keys = [key for key in keys if key]
+        self.strategy = strategy
+        self.daily_quota = daily_quota
+        self.units_spent = defaultdict(int)
+        self.units_by_endpoint = defaultdict(lambda: defaultdict(int))
+        self.exhausted_until = {}
+        self._next_index = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset_at = time.time() + seconds_until_quota_reset()
+
+    def _maybe_reset(self):
+        if time.time() >= self._reset_at:
+            self.units_spent.clear()
+            self.units_by_endpoint.clear()
+            self.exhausted_until.clear()
+            self._reset_at = time.time() + seconds_until_quota_reset()
+
+    def _available(self, key, cost):
+        if self.exhausted_until.get(key, 0) > time.time():
+            return False
+        return self.units_spent[key] + cost <= self.daily_quota
+
+    def acquire(self, endpoint):
+        # Returns None once every key is out of quota for this endpoint.
+        cost = quota_cost(endpoint)
+        with self._lock:
+            self._maybe_reset()
+            candidates = [key for key in self.keys if self._available(key, cost)]
+            if not candidates:
+                return None
+
+            if self.strategy == 'least_used':
+                key = min(candidates, key=lambda k: self.units_spent[k])
+            else:
+                key = None
+                for offset in range(len(self.keys)):
+                    index = (self._next_index + offset) % len(self.keys)
+                    if self.keys[index] in candidates:
+                        key = self.keys[index]
+                        self._next_index = index + 1
+                        break
+
+            self.units_spent[key] += cost
+            self.units_by_endpoint[key][endpoint] += cost
+
+            for usage in self.current_usages():
+                usage.units += cost
+                usage.calls += 1
+                usage.units_by_endpoint[endpoint] += cost
+                usage.units_by_key[self.keys.index(key)] += cost
+
+        return key
+
+    def mark_exhausted(self, key):
+        # Called on 403 quotaExceeded: the key stays out of rotation until the daily reset.
+        with self._lock:
+            self.exhausted_until[key] = time.time() + seconds_until_quota_reset()
+            self.units_spent[key] = max(self.units_spent[key], self.daily_quota)
+
+    def backoff(self, attempt, base=0.5, cap=30.0):
+        # Full jitter exponential backoff for 429 / rateLimitExceeded responses.
+        time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+    @contextmanager
+    def track(self):
+        """Collect the quota units spent by API calls made on this thread inside the block."""
+        usage = RequestUsage()
+        usages = getattr(self._local, 'usages', None)
+        if usages is None:
+            usages = self._local.usages = []
+        usages.append(usage)
+        try:
+            yield usage
+        finally:
+            usages.remove(usage)
+
+    def current_usages(self):
+        return list(getattr(self._local, 'usages', []))
+
+    @contextmanager
+    def attach(self, usages):
+        # Lets worker threads report into the trackers opened by the thread that spawned them.
+        previous = getattr(self._local, 'usages', None)
+        self._local.usages = list(usages)
+        try:
+            yield
+        finally:
+            self._local.usages = previous if previous is not None else []
+
+    def stats(self):
+        with self._lock:
+            return {
+                index: {
+                    'units_spent': self.units_spent[key],
+                    'units_remaining': max(self.daily_quota - self.units_spent[key], 0),
+                    'units_by_endpoint': dict(self.units_by_endpoint[key]),
+                    'exhausted': self.exhausted_until.get(key, 0) > time.time(),
+                }
+                for index, key in enumerate(self.keys)
+            }
+
+
+key_manager = KeyManager(APIS)
\ No newline at end of file
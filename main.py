@@ -1,179 +1,73 @@
 from prompt import prompts
 
-import streamlit as st
 import pandas as pd
-import pycountry
-from collections import Counter
-from sklearn.cluster import KMeans
+import streamlit as st
 import time
 
-from utility import (get_category, get_channel_info, get_video_details, get_video_statistics, 
-                    get_summarized, closest_to_centroid, inference, get_best_similar_video, 
-                    postprocess_model_output, process_distribution)
-
-from models import model
-
-@st.cache_data
-def fetch_channel_data(channel_id):
-    channel_info = get_channel_info(channel_id)
-    channel_data = channel_info['items'][0]
-    snippet = channel_data.get('snippet', {})
-    content_details = channel_data.get('contentDetails', {})
-    statistics = channel_data.get('statistics', {})
-    default_image = channel_info['items'][0]['snippet']['thumbnails']['medium']['url']
-    datetime = pd.to_datetime(channel_info['items'][0]['snippet']['publishedAt'])
-    publishedAt = datetime.strftime('%Y-%m-%d')
-    country_code = channel_info['items'][0]['snippet']['country']
-    country = pycountry.countries.get(alpha_2=country_code)
-    country = country.name
-    video_ids = get_video_details(content_details)
-    all_video_details = get_video_statistics(video_ids)
-    
-    if not all_video_details.empty:
-        all_video_details['Published_date'] = pd.to_datetime(all_video_details['Published_date'])
-        all_video_details['Views'] = pd.to_numeric(all_video_details['Views'])
-        all_video_details['Likes'] = pd.to_numeric(all_video_details['Likes'])
-        all_video_details['Comments'] = pd.to_numeric(all_video_details['Comments'])
-        
-        all_video_details['Month'] = all_video_details['Published_date'].dt.strftime('%b')
-        all_video_details['Day_of_Month'] = all_video_details['Published_date'].dt.day
-        all_video_details['Day_of_Week'] = all_video_details['Published_date'].dt.day_name()
-        
-        all_video_details['Published_date_str'] = all_video_details['Published_date'].dt.strftime('%Y-%m-%d')
-    
-        # Sorted 
-        sorted_video = all_video_details.sort_values(by="Views", ascending=False)
-        
-        # Video upload distributions
-        video_uploaded_month = process_distribution(all_video_details, 'Month')
-        video_uploaded_day = process_distribution(all_video_details, 'Day_of_Month')
-        video_uploaded_weekday = process_distribution(all_video_details, 'Day_of_Week')
-
-        # Likes distributions
-        likes_by_month = process_distribution(all_video_details, 'Month', 'Likes')
-        likes_by_day = process_distribution(all_video_details, 'Day_of_Month', 'Likes')
-        likes_by_weekday = process_distribution(all_video_details, 'Day_of_Week', 'Likes')
-
-        # Views distributions
-        views_by_month = process_distribution(all_video_details, 'Month', 'Views')
-        views_by_day = process_distribution(all_video_details, 'Day_of_Month', 'Views')
-        views_by_weekday = process_distribution(all_video_details, 'Day_of_Week', 'Views')
-    
-    return {
-        'channel_info': channel_info,
-        'snippet': snippet,
-        'statistics': statistics,
-        'default_image': default_image,
-        'publishedAt': publishedAt,
-        'country': country,
-        'all_video_details': all_video_details,
-        'sorted_video': sorted_video,
-        'video_uploaded_month': video_uploaded_month,
-        'video_uploaded_day': video_uploaded_day,
-        'video_uploaded_weekday': video_uploaded_weekday,
-        'likes_by_month': likes_by_month,
-        'likes_by_day': likes_by_day,
-        'likes_by_weekday': likes_by_weekday,
-        'views_by_month': views_by_month,
-        'views_by_day': views_by_day,
-        'views_by_weekday': views_by_weekday
-    }
+from utility import (stream_inference, inference, postprocess_model_output, lookup_recommendation,
+                     store_recommendation)
+from pipeline import get_video_description
+import pipeline
 
-def get_recommendations(all_video_details):
-    top_100_videos = all_video_details.sort_values(by="Views", ascending=False).head(100)
-    all_tags = set()
-    for tags in top_100_videos['Tags']:
-        for tag in tags:
-            all_tags.add(tag)
-    all_tags_list = [tag for tags in top_100_videos['Tags'] for tag in tags]
-    tag_counter = Counter(all_tags_list)
-    most_common_tags = [tag for tag, count in tag_counter.most_common(50)]
-    top_category_ids = list(set(top_100_videos['Category_id']))
-    top_category, _ = get_category(top_category_ids)
-    result, text = get_best_similar_video(most_common_tags, top_category)
-    top_100_videos['content'] = top_100_videos['Title'] + top_100_videos['Description']
-    temp_top = top_100_videos['content'].tolist()
-    
-    embeddings = model.encode(temp_top)
-    n_clusters = 10
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(embeddings)
-    centroids = kmeans.cluster_centers_
-    representative_indices = [closest_to_centroid(centroid, embeddings) for centroid in centroids]
-    representative_strings = [temp_top[idx] for idx in representative_indices]
-    summarize_1 = get_summarized(result)
-    summarize_2 = get_summarized(representative_strings)
-    all_videos_description = ""
-    
-    for i, text in enumerate(summarize_1):
-        all_videos_description += f"Video {i} : " + text + ". \n"
-        
-    for j, text in enumerate(summarize_2):
-        all_videos_description += f"Video {i + j} : " + text + ". \n"
-        
-    return inference(all_videos_description)
+import models
+from constants import INFERENCE_BATCHING, POLL_INTERVAL
+from aggregation import MONTH_ORDER, MONTH_DTYPE
+from tracing import trace_request
+import jobs
 
-st.set_page_config(layout="wide", page_title="YouTube Channel Analyzer")
+def load_channel(job, channel_id):
+    uploads = pd.Series(0, index=pd.CategoricalIndex(MONTH_ORDER, dtype=MONTH_DTYPE, name='Month'), name='Count')
 
-st.markdown("""
-    <style>
-    .main > div {
-        padding-top: 2rem;
-    }
-    .stButton>button {
-        width: auto;
-        display: block;
-        margin: 0 auto;
-    }
-    .title-container {
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        margin-bottom: 2rem;
-    }
-    .channel-id-input {
-        max-width: 600px !important;
-        margin-left: auto !important;
-        margin-right: auto !important;
-    }
-    .channel-info {
-        display: flex;
-        align-items: flex-start;
-    }
-    .channel-text {
-        flex: 2;
-        padding-right: 2rem;
-    }
-    .channel-image {
-        flex: 1;
-        display: flex;
-        justify-content: center;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    def on_page(videos, loaded):
+        # Partial results for the page to chart while the rest of the channel is still being fetched
+        for video in videos:
+            uploads.iloc[int(video['snippet']['publishedAt'][5:7]) - 1] += 1
+        job.update(loaded=loaded, uploads=uploads.copy())
 
-st.markdown('<div class="title-container"><h1>YouTube Channel Analyzer</h1></div>', unsafe_allow_html=True)
+    return pipeline.fetch_channel_data(channel_id, on_page, lambda overview: job.update(overview=overview))
 
+def recommend(job, all_video_details, tag_index, refresh=False):
+    with trace_request('get_recommendations') as trace:
+        job.update(stage='Analyzing channel content...')
+        video_description, description_embedding = get_video_description(all_video_details, tag_index)
 
-col1, col2, col3 = st.columns([1,2,1])
-with col2:
-    channel_id = st.text_input('Enter YouTube Channel ID', key="channel_id_input")
-    st.markdown(
-        """
-        <style>
-        [data-testid="stTextInput"] {
-            max-width: 600px;
-            margin-left: auto;
-            margin-right: auto;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        stats = None
+        # The same top videos, model and prompt give the same answer, so a repeat view skips generation
+        cached = None if refresh else lookup_recommendation(video_description, description_embedding)
+        if cached is not None:
+            text = postprocess_model_output(cached)
+            job.update(text=text)
+        elif INFERENCE_BATCHING:
+            job.update(stage='Generating recommendations...')
+            # Batched requests finish together, so the answer is shown once it is complete.
+            # The cache was already checked above.
+            recommendations = inference(video_description, refresh=True, embedding=description_embedding)
+            if recommendations is None:
+                raise RuntimeError('The inference worker could not process the request')
+            text = postprocess_model_output(recommendations)
+        else:
+            job.update(stage='Generating recommendations...')
+            # Tokens are published as soon as the backend produces them
+            stream = stream_inference(video_description)
+            text = ''
+            for token in stream:
+                text += token
+                job.update(text=text)
+            stats = stream.stats
+            store_recommendation(video_description, text, description_embedding)
 
-if channel_id:
-    with st.spinner('Fetching channel data...'):
-        data = fetch_channel_data(channel_id)
+    return {'text': text, 'stats': stats, 'trace': trace, 'cached': cached is not None}
+
+def session_job(name, channel_id, fn, *args):
+    # The job is kept in session state, so reruns reuse its result instead of running it again
+    session_jobs = st.session_state.setdefault(name, {})
+    job = session_jobs.get(channel_id)
+    if job is None:
+        job = jobs.submit((name, channel_id), fn, *args)
+        session_jobs[channel_id] = job
+    return job
 
+def render_overview(overview):
     col_left, col_middle, col_right = st.columns([1, 3, 1])
         
     with col_middle:
@@ -183,26 +77,75 @@ if channel_id:
         with col_text:
             st.subheader("Channel Information")
             st.markdown(f"""
-            **Channel Name:** {data['snippet']['title']}  
-            **Subscribers:** {data['statistics']['subscriberCount']}  
-            **Total Views:** {data['statistics']['viewCount']}  
-            **Total Videos:** {data['statistics']['videoCount']}  
-            **Published At:** {data['publishedAt']}  
-            **Country:** {data['country']}
+            **Channel Name:** {overview['snippet']['title']}  
+            **Subscribers:** {overview['statistics']['subscriberCount']}  
+            **Total Views:** {overview['statistics']['viewCount']}  
+            **Total Videos:** {overview['statistics']['videoCount']}  
+            **Published At:** {overview['publishedAt']}  
+            **Country:** {overview['country']}
             """)
 
         with col_image:
-            st.image(data['default_image'], width=200)
+            st.image(overview['default_image'], width=200)
 
         st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("---")
 
+@st.fragment(run_every=POLL_INTERVAL)
+def render_channel_progress(job):
+    # Only this fragment reruns while the channel loads; the whole page reruns once it is done
+    if job.done:
+        st.rerun()
+
+    state = job.snapshot()
+    if 'overview' not in state:
+        st.caption('Fetching channel data...')
+        return
+
+    render_overview(state['overview'])
+    total = int(state['overview']['statistics'].get('videoCount') or 0)
+    loaded = state.get('loaded', 0)
+    st.progress(min(loaded / max(total, 1), 1.0), text=f'Loaded {loaded} videos...')
+    if 'uploads' in state:
+        st.subheader('Monthly Video Upload Distribution')
+        st.bar_chart(state['uploads'])
+
+@st.fragment(run_every=POLL_INTERVAL)
+def render_recommendation_progress(job):
+    if job.done:
+        st.rerun()
+
+    state = job.snapshot()
+    st.caption(state.get('stage', 'Starting...'))
+    if state.get('text'):
+        st.markdown(state['text'] + ' ▌')
+
+def render_recommendations(job):
+    if job.error is not None:
+        st.write("Sorry, the model couldn't process the request right now.")
+        return
+
+    result = job.result
+    st.write(result['text'])
+    if result['cached']:
+        st.caption('Served from the recommendation cache')
+    elif result['stats'] is not None:
+        st.caption(f"Time to first token: {result['stats'].time_to_first_token or 0:.2f}s · "
+                   f"{result['stats'].tokens_per_second or 0:.1f} tokens/s")
+    render_performance_panel(result['trace'])
+
+def render_channel_charts(data):
     col1, col2 = st.columns(2)
 
     with col1:
         st.subheader('Video Statistics')
-        st.dataframe(data['sorted_video'], height=300)
+        st.dataframe(data['all_video_details'].iloc[data['sort_index']], height=300)
+        memory = data['memory']
+        limit = f" of {memory['limit_bytes'] / 2 ** 20:.0f} MB" if memory['limit_bytes'] else ''
+        st.caption(f"{memory['videos']} videos, {memory['video_table_bytes'] / 2 ** 20:.1f} MB{limit} in memory")
+        if memory['truncated']:
+            st.warning('Only the most recent uploads are analysed, the channel is larger than MEMORY_LIMIT_MB allows.')
         
     with col2:
         st.subheader('Monthly Video Upload Distribution')
@@ -245,14 +188,139 @@ if channel_id:
         st.subheader('Day of Week Average Views')
         st.line_chart(data['views_by_weekday'].set_index('Day_of_Week'))
 
+    col11, col12 = st.columns(2)
+    with col11:
+        st.subheader('Channel Views Gained per Day')
+        if len(data['channel_growth']) > 1:
+            st.line_chart(data['channel_growth'].set_index('Fetched_at')[['Views_per_day']])
+        else:
+            st.caption('Growth appears once the channel statistics have been fetched again after they changed.')
+
+    with col12:
+        st.subheader('Fastest Growing Videos')
+        if len(data['video_velocity']):
+            st.bar_chart(data['video_velocity'].set_index('Title')[['Views_per_day']])
+        else:
+            st.caption('Views per day are shown from the second snapshot of the channel.')
+
+    col13, col14 = st.columns(2)
+    with col13:
+        st.subheader('Most Used Tags')
+        top_tags = data['tag_index'].top_tags(20)
+        if top_tags:
+            st.bar_chart(pd.DataFrame(top_tags, columns=['Tag', 'Videos']).set_index('Tag'))
+
+    with col14:
+        st.subheader('Tag Clusters')
+        for cluster in data['tag_index'].clusters(30)[:8]:
+            st.markdown('- ' + ', '.join(cluster))
+
     st.markdown("---")
 
-    if st.button('Get Recommendations'):
-        with st.spinner('Analyzing channel content...'):
-            recommendations = get_recommendations(data['all_video_details'])
+def render_performance_panel(trace):
+    with st.expander("Performance", expanded=False):
+        st.dataframe(trace.rows(), hide_index=True, use_container_width=True)
+        info = trace.as_dict()
+        st.json({
+            'counters': info['counters'],
+            'quota_units_by_key': info['quota_units_by_key'],
+            'quota_units_by_endpoint': info['quota_units_by_endpoint'],
+            'peak_rss_mb': round(info['peak_rss_bytes'] / 2 ** 20, 1) if info['peak_rss_bytes'] else None,
+            'gpu_peak_mb': round(info['gpu_peak_bytes'] / 2 ** 20, 1) if info['gpu_peak_bytes'] else None,
+        })
+        st.download_button('Download OpenMetrics', trace.to_openmetrics(), file_name='trace.txt')
+
+st.set_page_config(layout="wide", page_title="YouTube Channel Analyzer")
+
+st.markdown("""
+    <style>
+    .main > div {
+        padding-top: 2rem;
+    }
+    .stButton>button {
+        width: auto;
+        display: block;
+        margin: 0 auto;
+    }
+    .title-container {
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        margin-bottom: 2rem;
+    }
+    .channel-id-input {
+        max-width: 600px !important;
+        margin-left: auto !important;
+        margin-right: auto !important;
+    }
+    .channel-info {
+        display: flex;
+        align-items: flex-start;
+    }
+    .channel-text {
+        flex: 2;
+        padding-right: 2rem;
+    }
+    .channel-image {
+        flex: 1;
+        display: flex;
+        justify-content: center;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+st.markdown('<div class="title-container"><h1>YouTube Channel Analyzer</h1></div>', unsafe_allow_html=True)
 
-        if recommendations is None:
-            st.write("Sorry, the model couldn't process the request right now.")
+
+col1, col2, col3 = st.columns([1,2,1])
+with col2:
+    channel_id = st.text_input('Enter YouTube Channel ID', key="channel_id_input")
+    st.markdown(
+        """
+        <style>
+        [data-testid="stTextInput"] {
+            max-width: 600px;
+            margin-left: auto;
+            margin-right: auto;
+        }
+        </style>
+        """,
+        unsafe_allow_html=True,
+    )
+
+if channel_id:
+    channel_job = session_job('channel', channel_id, load_channel, channel_id)
+    if not channel_job.done:
+        render_channel_progress(channel_job)
+    elif channel_job.error is not None:
+        # Forgotten, so the next interaction tries again
+        del st.session_state['channel'][channel_id]
+        st.error(f"Could not load channel {channel_id}: {channel_job.error}")
+    else:
+        data = channel_job.result
+        render_overview(data)
+        render_channel_charts(data)
+
+        if models.ANALYTICS_ONLY:
+            st.info("Recommendations are disabled in analytics only mode.")
+        elif len(data['all_video_details']) == 0:
+            st.info("This channel has no public videos to base recommendations on.")
         else:
-            st.subheader('Content Recommendations')
-            st.write(postprocess_model_output(recommendations))
+            recommendation_job = st.session_state.setdefault('recommendations', {}).get(channel_id)
+            # A second click while the job runs attaches to it instead of starting another one
+            refresh = st.checkbox('Ignore cached recommendations',
+                                  help='Generate a new answer even if this channel was analysed recently')
+            if st.button('Get Recommendations'):
+                recommendation_job = jobs.submit(('recommendations', channel_id), recommend,
+                                               data['all_video_details'], data['tag_index'], refresh)
+                st.session_state['recommendations'][channel_id] = recommendation_job
+
+            if recommendation_job is not None:
+                st.subheader('Content Recommendations')
+                if recommendation_job.done:
+                    render_recommendations(recommendation_job)
+                else:
+                    render_recommendation_progress(recommendation_job)
+
+# Models load in the background once the dashboard has rendered
+models.warm_up()
@@ -0,0 +1,92 @@
+import base64
+import json
+import threading
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from constants import MODEL_SERVER_URL, MODEL_SERVER_TIMEOUT, HTTP_POOL_SIZE
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+                _session = session
+    return _session
+
+
+class ModelServerError(RuntimeError):
+    pass
+
+
+def post(path, payload, stream=False):
+    response = _get_session().post(f'{MODEL_SERVER_URL}/{path}', json=payload, stream=stream,
+                                   timeout=MODEL_SERVER_TIMEOUT)
+    response.raise_for_status()
+    return response if stream else response.json()
+
+
+def count_tokens(texts):
+    # Token counts of the generation model for a list of texts, in one request
+    return post('count_tokens', {'texts': list(texts)})['tokens']
+
+
+def decode_array(data):
+    return np.frombuffer(base64.b64decode(data['data']), dtype=data['dtype']).reshape(data['shape'])
+
+
+class RemoteTokenizer:
+    # Tokenizer of the summarizer, with the call signature summarize_batch relies on
+    def __call__(self, texts, truncation=True, max_length=None):
+        single = isinstance(texts, str)
+        result = post('tokenize', {'texts': [texts] if single else list(texts), 'truncation': truncation,
+                                   'max_length': max_length})
+        return {'input_ids': result['input_ids'][0] if single else result['input_ids']}
+
+
+class RemoteSummarizer:
+    """Calls the summarizer hosted by model_server.py like a local summarization pipeline."""
+
+    def __init__(self):
+        self.tokenizer = RemoteTokenizer()
+
+    def __call__(self, texts, **kwargs):
+        return post('summarize', {'texts': list(texts), 'kwargs': kwargs})['summaries']
+
+
+class RemoteEmbedder:
+    def encode(self, texts):
+        return decode_array(post('embed', {'texts': list(texts)})['embeddings'])
+
+
+class RemoteGenerator:
+    """Generation backend that forwards to model_server.py; tokens are streamed back as they are produced."""
+
+    def cache_prefix(self, prefix):
+        # The server prefills the prompt template once for every client
+        pass
+
+    def stream(self, prompt, max_new_tokens):
+        response = post('generate', {'prompt': prompt, 'max_new_tokens': max_new_tokens, 'stream': True}, stream=True)
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    message = json.loads(line)
+                    # A generation that failed after streaming started ends with an error line
+                    if 'error' in message:
+                        raise ModelServerError(message['error'])
+                    yield message['text']
+
+    def generate_batch(self, prompts, max_new_tokens):
+        return post('generate', {'prompts': list(prompts), 'max_new_tokens': max_new_tokens})['texts']
+
+    def count_tokens(self, text):
+        return post('count_tokens', {'text': text})['tokens']
@@ -0,0 +1,185 @@
+"""
+    Hosts the summarizer, embedder and generator once, for every app process on the host.
+
+    App processes started with MODEL_SERVER_URL set load thin clients from model_client.py instead
+    of their own copies of the weights. Concurrent summarize, embed and non-streamed generate
+    requests are grouped into batches by InferenceWorker; streamed generations are queued on the
+    same worker and run one at a time between batches.
+
+    Example:
+        python model_server.py --port 8766
+        MODEL_SERVER_URL=http://127.0.0.1:8766 streamlit run main.py
+"""
+import argparse
+import base64
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The server hosts the models itself, so it must never load the remote clients
+os.environ.pop('MODEL_SERVER_URL', None)
+
+import models
+from batching import InferenceWorker
+from constants import SUMMARY_BATCH_SIZE, MAX_BATCH_SIZE, MAX_BATCH_WAIT
+from prompt_builder import template_parts
+
+
+def encode_array(array):
+    return {'data': base64.b64encode(array.tobytes()).decode('ascii'), 'dtype': str(array.dtype),
+            'shape': list(array.shape)}
+
+
+class _ListBackend:
+    # Lets InferenceWorker batch list-in list-out calls: each request is (texts, options)
+    def __init__(self, fn):
+        self.fn = fn
+
+    def generate_batch(self, requests, max_new_tokens):
+        results = [None] * len(requests)
+        groups = {}
+        for i, (texts, options) in enumerate(requests):
+            groups.setdefault(options, []).append(i)
+
+        # One model call per distinct set of options, usually a single call for the whole batch
+        for options, indices in groups.items():
+            texts = [text for i in indices for text in requests[i][0]]
+            outputs = self.fn(texts, **dict(options)) if texts else []
+            start = 0
+            for i in indices:
+                results[i] = outputs[start:start + len(requests[i][0])]
+                start += len(requests[i][0])
+        return results
+
+
+class ModelService:
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT):
+        models.warm_up(background=False)
+        self.generator = models.get_generator()
+        self.generator.cache_prefix(template_parts()[0])
+
+        summarizer = models.get_summarizer()
+        embedder = models.get_embedder()
+        self.summarizer = summarizer
+        self.summarize_worker = InferenceWorker(
+            _ListBackend(lambda texts, **kwargs: summarizer(texts, **{'batch_size': SUMMARY_BATCH_SIZE, **kwargs})),
+            max_batch_size, max_wait)
+        self.embed_worker = InferenceWorker(_ListBackend(lambda texts: embedder.encode(texts)), max_batch_size,
+                                            max_wait)
+        self.generate_worker = InferenceWorker(self.generator, max_batch_size, max_wait)
+
+    def summarize(self, request):
+        options = tuple(sorted(request.get('kwargs', {}).items()))
+        return {'summaries': self.summarize_worker.generate((request['texts'], options), 0)}
+
+    def embed(self, request):
+        return {'embeddings': encode_array(self.embed_worker.generate((request['texts'], ()), 0))}
+
+    def tokenize(self, request):
+        kwargs = {'truncation': request.get('truncation', True)}
+        if request.get('max_length'):
+            kwargs['max_length'] = request['max_length']
+        return {'input_ids': self.summarizer.tokenizer(request['texts'], **kwargs)['input_ids']}
+
+    def generate(self, request):
+        futures = [self.generate_worker.submit(prompt, request['max_new_tokens']) for prompt in request['prompts']]
+        return {'texts': [future.result() for future in futures]}
+
+    def count_tokens(self, request):
+        if 'texts' in request:
+            return {'tokens': [self.generator.count_tokens(text) for text in request['texts']]}
+        return {'tokens': self.generator.count_tokens(request['text'])}
+
+    def health(self):
+        return {'models': sorted(name for name in ('summarizer', 'embedder', 'tokenizer', 'generator')
+                                 if models.is_loaded(name)),
+                'load_times': models.load_times,
+                'batching': {'summarize': self.summarize_worker.metrics(), 'embed': self.embed_worker.metrics(),
+                             'generate': self.generate_worker.metrics()}}
+
+
+class ModelHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    service = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request):
+        # Chunked NDJSON, one line per text chunk as the backend produces it
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            # Streams share the generate worker with batches, so only one thread drives the backend
+            for chunk in self.service.generate_worker.stream(request['prompt'], request['max_new_tokens']):
+                self._write_line({'text': chunk})
+        except Exception as e:
+            # Headers are already sent, so the error is reported as the last line of the stream
+            print(f'An error occurred while streaming a generation: {str(e)}')
+            self._write_line({'error': str(e)})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_line(self, payload):
+        line = (json.dumps(payload) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(line):x}\r\n'.encode('ascii') + line + b'\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        endpoint = self.path.strip('/')
+        try:
+            if endpoint == 'generate' and request.get('stream'):
+                self._stream(request)
+                return
+            if endpoint not in ('summarize', 'embed', 'tokenize', 'generate', 'count_tokens'):
+                self._send_json(404, {'error': f'Unknown endpoint {endpoint}'})
+                return
+            self._send_json(200, getattr(self.service, endpoint)(request))
+        except Exception as e:
+            print(f'An error occurred while serving {endpoint}: {str(e)}')
+            self._send_json(500, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, host='127.0.0.1'):
+    # Loads every model before the server accepts connections; returns the running server
+    handler = type('Handler', (ModelHandler,), {'service': ModelService()})
+    server_class = type('Server', (ThreadingHTTPServer,), {'request_queue_size': 128})
+    server = server_class((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='model-server', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the summarizer, embedder and generator to app processes.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--stub', action='store_true', help='Serve the stub models from stub_models.py')
+    args = parser.parse_args()
+
+    if args.stub:
+        from stub_models import register_stub_models
+
+        register_stub_models()
+
+    server = start_server(args.port, args.host)
+    print(f'Serving models on http://{args.host}:{server.server_port}')
+    threading.Event().wait()
@@ -1,34 +1,187 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from sentence_transformers import SentenceTransformer
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from constants import GENERATION_BACKEND, GENERATION_MODEL_ID, LLAMA_CPP_MODEL_PATH, MODEL_SERVER_URL
+
 load_dotenv()
 
+# In analytics only mode the app never imports torch or transformers.
+ANALYTICS_ONLY = os.getenv('ANALYTICS_ONLY', '').lower() in ('1', 'true', 'yes')
+
+if os.getenv('HUGGING_FACE_API_KEY'):
+    os.environ['HF_TOKEN'] = os.getenv('HUGGING_FACE_API_KEY')
+
+summarizer_id = 'sshleifer/distilbart-cnn-12-6'
+embedder_id = 'all-MiniLM-L6-v2'
+model_id = GENERATION_MODEL_ID
+
+
+class AnalyticsOnlyError(RuntimeError):
+    pass
+
+
 def get_device():
+    import torch
+
     if torch.cuda.is_available():
         return "cuda"
     else:
         return "cpu"
-    
-    
-device = get_device()
 
-os.environ['HF_TOKEN'] = os.getenv('HUGGING_FACE_API_KEY')
 
-summarizer = pipeline("summarization", model='sshleifer/distilbart-cnn-12-6', device=device)
-model = SentenceTransformer('all-MiniLM-L6-v2')
+def _load_summarizer():
+    from transformers import pipeline
+
+    return pipeline("summarization", model=summarizer_id, device=get_device())
+
+
+def _load_embedder():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(embedder_id)
+
+
+def _load_tokenizer():
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_id)
+
+
+def _load_generator():
+    from generation import TransformersBackend, LlamaCppBackend, StubBackend
+
+    if GENERATION_BACKEND == 'llama_cpp':
+        return LlamaCppBackend(LLAMA_CPP_MODEL_PATH)
+    if GENERATION_BACKEND == 'stub':
+        return StubBackend()
+    return TransformersBackend(model_id, get_tokenizer())
+
+
+def _load_token_counter():
+    # Counts prompt tokens of the generation model without loading its weights; takes and returns lists
+    if GENERATION_BACKEND == 'llama_cpp':
+        from llama_cpp import Llama
+
+        vocabulary = Llama(model_path=LLAMA_CPP_MODEL_PATH, vocab_only=True, verbose=False)
+        return lambda texts: [len(vocabulary.tokenize(text.encode('utf-8'), add_bos=False)) for text in texts]
+    if GENERATION_BACKEND == 'stub':
+        from generation import StubBackend
+
+        stub = StubBackend()
+        return lambda texts: [stub.count_tokens(text) for text in texts]
+    tokenizer = get_tokenizer()
+    return lambda texts: [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
+
+def _remote_loaders():
+    # Thin clients of model_server.py, the weights are loaded once by the server.
+    # There is no remote 'tokenizer': the generation tokenizer stays on the server next to the generator,
+    # prompts are counted through count_tokens and the summarizer carries its own remote tokenizer.
+    from model_client import RemoteSummarizer, RemoteEmbedder, RemoteGenerator, count_tokens
+
+    return {
+        'summarizer': RemoteSummarizer,
+        'embedder': RemoteEmbedder,
+        'generator': RemoteGenerator,
+        'token_counter': lambda: count_tokens,
+    }
+
+
+_loaders = _remote_loaders() if MODEL_SERVER_URL else {
+    'summarizer': _load_summarizer,
+    'embedder': _load_embedder,
+    'tokenizer': _load_tokenizer,
+    'generator': _load_generator,
+    'token_counter': _load_token_counter,
+}
+_models = {}
+_locks = {name: threading.Lock() for name in _loaders}
+_warm_up_thread = None
+
+# Seconds spent loading each model, filled in as models are loaded.
+load_times = {}
+
+
+def register(name, loader):
+    # Replace how a model is loaded, e.g. with a small stub for tests and benchmarks.
+    _loaders[name] = loader
+    _locks.setdefault(name, threading.Lock())
+    _models.pop(name, None)
+    load_times.pop(name, None)
+
+
+def get(name):
+    if name in _models:
+        return _models[name]
+
+    if ANALYTICS_ONLY:
+        raise AnalyticsOnlyError(f'The {name} model is not available in analytics only mode')
+    if name not in _loaders:
+        raise KeyError(f'No {name} model is available with this configuration')
+
+    with _locks[name]:
+        if name not in _models:
+            start = time.perf_counter()
+            _models[name] = _loaders[name]()
+            load_times[name] = time.perf_counter() - start
+            print(f'Loaded {name} in {load_times[name]:.1f}s')
+
+    return _models[name]
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def get_summarizer():
+    return get('summarizer')
+
+
+def get_embedder():
+    return get('embedder')
+
+
+def get_tokenizer():
+    return get('tokenizer')
+
+
+def get_generator():
+    return get('generator')
+
+
+def count_tokens(texts):
+    return get('token_counter')(texts)
+
+
+def warm_up(names=('embedder', 'summarizer', 'tokenizer', 'generator'), background=True):
+    """Load the given models ahead of their first use, by default on a daemon thread."""
+    global _warm_up_thread
+    if ANALYTICS_ONLY:
+        return None
+
+    def load_all():
+        # Names without a loader, e.g. the tokenizer when models are served remotely, are skipped
+        for name in [name for name in names if name in _loaders]:
+            try:
+                get(name)
+            except Exception as e:
+                print(f'An error occurred while warming up {name}: {str(e)}')
+
+    if not background:
+        load_all()
+        return None
 
-model_id = "meta-llama/Meta-Llama-3.1-8B-Instruct"
-tokenizer = AutoTokenizer.from_pretrained(model_id)
-recommendator = AutoModelForCausalLM.from_pretrained(model_id, load_in_8bit=True)
+    if _warm_up_thread is None or not _warm_up_thread.is_alive():
+        _warm_up_thread = threading.Thread(target=load_all, name='model-warm-up', daemon=True)
+        _warm_up_thread.start()
+    return _warm_up_thread
 
-torch.backends.cuda.enable_mem_efficient_sdp(False)
-torch.backends.cuda.enable_flash_sdp(False)
 
-generator = pipeline(
-    'text-generation',
-    model=recommendator,
-    tokenizer=tokenizer
-)
\ No newline at end of file
+def __getattr__(name):
+    # Keeps `models.summarizer`, `models.model`, ... working while loading them lazily.
+    aliases = {'summarizer': 'summarizer', 'model': 'embedder', 'tokenizer': 'tokenizer', 'generator': 'generator'}
+    if name in aliases:
+        return get(aliases[name])
+    raise AttributeError(f"module 'models' has no attribute '{name}'")
\ No newline at end of file
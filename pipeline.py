@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pycountry
+
+from utility import (get_category, get_channel_info, get_channel_videos, load_descriptions,
+                    get_summarized, inference, get_best_similar_video, encode_texts)
+
+from constants import TOP_VIDEOS, MEMORY_LIMIT_MB, INFERENCE_BATCHING
+from representatives import select_representatives, normalize
+from aggregation import aggregate, MONTH_DTYPE, DAY_OF_WEEK_DTYPE
+from snapshots import snapshot_store, growth
+from tag_index import TagIndex, get_tag_index
+from tracing import traced
+from prompt_builder import build_video_description
+import models
+
+def get_channel_overview(channel_id):
+    channel_info = get_channel_info(channel_id)
+    if not channel_info or not channel_info.get('items'):
+        raise ValueError(f'Channel {channel_id} was not found')
+    channel_data = channel_info['items'][0]
+    datetime = pd.to_datetime(channel_data['snippet']['publishedAt'])
+    # Channels are not required to set a country
+    country_code = channel_data['snippet'].get('country')
+    country = pycountry.countries.get(alpha_2=country_code) if country_code else None
+    return {
+        'channel_info': channel_info,
+        'snippet': channel_data.get('snippet', {}),
+        'content_details': channel_data.get('contentDetails', {}),
+        'statistics': channel_data.get('statistics', {}),
+        'default_image': channel_data['snippet']['thumbnails']['medium']['url'],
+        'publishedAt': datetime.strftime('%Y-%m-%d'),
+        'country': country.name if country else 'Unknown',
+    }
+
+def memory_footprint(all_video_details, tag_index):
+    return {
+        'videos': len(all_video_details),
+        'video_table_bytes': int(all_video_details.memory_usage(deep=True).sum()),
+        'tag_index_bytes': int(tag_index.matrix.data.nbytes + tag_index.matrix.indices.nbytes
+                               + tag_index.matrix.indptr.nbytes),
+        'limit_bytes': int(MEMORY_LIMIT_MB * 2 ** 20),
+        'truncated': bool(all_video_details.attrs.get('truncated')),
+    }
+
+@traced()
+def fetch_channel_data(channel_id, on_page=None, on_overview=None):
+    overview = get_channel_overview(channel_id)
+    if on_overview is not None:
+        on_overview(overview)
+    channel_info = overview['channel_info']
+    snippet = overview['snippet']
+    content_details = overview['content_details']
+    statistics = overview['statistics']
+    default_image = overview['default_image']
+    publishedAt = overview['publishedAt']
+    country = overview['country']
+    # Pages of videos are turned into rows as they arrive, on_page can render them progressively
+    all_video_details = get_channel_videos(content_details, on_page)
+
+    # Only statistics that changed since the previous fetch are appended to the history
+    snapshot_store.append(channel_id, all_video_details)
+    # The tag index only has to take in videos it has not seen yet
+    tag_index = get_tag_index(channel_id)
+    tag_index.add(all_video_details['Video_id'], all_video_details['Tags'])
+    channel_growth, video_velocity = growth(snapshot_store.history(channel_id), all_video_details)
+    
+    # One byte per row for the calendar columns instead of a string per video
+    published = all_video_details['Published_date'].dt
+    all_video_details['Month'] = pd.Categorical.from_codes((published.month - 1).astype('int8'), dtype=MONTH_DTYPE)
+    all_video_details['Day_of_Month'] = published.day.astype('int8')
+    all_video_details['Day_of_Week'] = pd.Categorical.from_codes(published.dayofweek.astype('int8'),
+                                                                 dtype=DAY_OF_WEEK_DTYPE)
+
+    # Row positions by views instead of a sorted copy of the frame
+    sort_index = np.argsort(-all_video_details['Views'].to_numpy(dtype=float, na_value=-1), kind='stable')
+
+    # Count and mean of every metric per time dimension, one pass per dimension.
+    # A channel without videos gets empty distributions instead of an error.
+    distributions = aggregate(all_video_details, ('Month', 'Day_of_Month', 'Day_of_Week'))
+
+    # Video upload distributions
+    video_uploaded_month = distributions['Month'][['Month', 'Count']]
+    video_uploaded_day = distributions['Day_of_Month'][['Day_of_Month', 'Count']]
+    video_uploaded_weekday = distributions['Day_of_Week'][['Day_of_Week', 'Count']]
+
+    # Likes distributions
+    likes_by_month = distributions['Month'][['Month', 'Likes']]
+    likes_by_day = distributions['Day_of_Month'][['Day_of_Month', 'Likes']]
+    likes_by_weekday = distributions['Day_of_Week'][['Day_of_Week', 'Likes']]
+
+    # Views distributions
+    views_by_month = distributions['Month'][['Month', 'Views']]
+    views_by_day = distributions['Day_of_Month'][['Day_of_Month', 'Views']]
+    views_by_weekday = distributions['Day_of_Week'][['Day_of_Week', 'Views']]
+    
+    return {
+        'channel_info': channel_info,
+        'snippet': snippet,
+        'statistics': statistics,
+        'default_image': default_image,
+        'publishedAt': publishedAt,
+        'country': country,
+        'all_video_details': all_video_details,
+        'sort_index': sort_index,
+        'memory': memory_footprint(all_video_details, tag_index),
+        'video_uploaded_month': video_uploaded_month,
+        'video_uploaded_day': video_uploaded_day,
+        'video_uploaded_weekday': video_uploaded_weekday,
+        'likes_by_month': likes_by_month,
+        'likes_by_day': likes_by_day,
+        'likes_by_weekday': likes_by_weekday,
+        'views_by_month': views_by_month,
+        'views_by_day': views_by_day,
+        'views_by_weekday': views_by_weekday,
+        'distributions': distributions,
+        'channel_growth': channel_growth,
+        'video_velocity': video_velocity,
+        'tag_index': tag_index
+    }
+
+@traced()
+def get_video_description(all_video_details, tag_index=None, select=select_representatives):
+    # select picks the representative videos from their embeddings, batch_cli runs it in a worker process
+    if len(all_video_details) == 0:
+        raise ValueError('A channel without videos has nothing to describe')
+    views = all_video_details['Views'].to_numpy(dtype=float, na_value=-1)
+    top_100_videos = all_video_details.iloc[np.argsort(-views, kind='stable')[:TOP_VIDEOS]]
+    if tag_index is None:
+        tag_index = TagIndex()
+        tag_index.add(top_100_videos['Video_id'], top_100_videos['Tags'])
+    most_common_tags = [tag for tag, count in tag_index.top_tags(50, top_100_videos['Video_id'])]
+    top_category_ids = list(set(top_100_videos['Category_id']))
+    top_category, _ = get_category(top_category_ids)
+    if 'Description' in top_100_videos:
+        descriptions = top_100_videos['Description'].tolist()
+    else:
+        descriptions = load_descriptions(top_100_videos['Video_id'])
+    temp_top = [title + description for title, description in zip(top_100_videos['Title'], descriptions)]
+    
+    embeddings = encode_texts(temp_top)
+    # The channel is described by the mean direction of its top videos
+    channel_embedding = normalize(embeddings).mean(axis=0)
+    result, text = get_best_similar_video(most_common_tags, top_category, channel_embedding,
+                                          exclude_ids=all_video_details['Video_id'])
+    representative_indices = select(embeddings)
+    representative_strings = [temp_top[idx] for idx in representative_indices]
+    summaries = get_summarized(result) + get_summarized(representative_strings)
+    summary_embeddings = encode_texts(summaries)
+
+    # Summaries are ranked, deduplicated and packed into the context left by the template and output
+    # Only the tokenizer is needed to count tokens, the generator is not loaded for a cached answer
+    video_description = build_video_description(summaries, summary_embeddings, channel_embedding,
+                                                models.count_tokens)
+    # The embedder truncates long inputs, so the description is represented by the mean of its summaries
+    description_embedding = normalize(summary_embeddings).mean(axis=0) if len(summaries) else None
+    return video_description, description_embedding
+
+@traced()
+def get_recommendations(all_video_details, tag_index=None, refresh=False, select=select_representatives,
+                        batching=INFERENCE_BATCHING):
+    video_description, description_embedding = get_video_description(all_video_details, tag_index, select)
+    return inference(video_description, refresh=refresh, embedding=description_embedding, batching=batching)
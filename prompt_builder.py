@@ -0,0 +1,90 @@
+import hashlib
+
+import numpy as np
+
+from constants import GENERATION_CONTEXT_LENGTH, MAX_NEW_TOKENS, PROMPT_DEDUPE_THRESHOLD
+from prompt import prompts
+from representatives import normalize
+from tracing import traced
+
+
+def template_parts(template=prompts):
+    # The text before the video list never changes, so backends can keep its KV cache around
+    prefix, suffix = template.template.split('{top_video}')
+    return prefix, suffix
+
+
+def prompt_version(template=prompts):
+    # Editing the prompt changes the version, so answers to the old prompt are not reused
+    return hashlib.sha1(template.template.encode('utf-8')).hexdigest()[:12]
+
+
+def prompt_budget(count_tokens, context_length=GENERATION_CONTEXT_LENGTH, max_new_tokens=MAX_NEW_TOKENS):
+    return context_length - max_new_tokens - sum(count_tokens(template_parts()))
+
+
+def rank_summaries(embeddings, query_embedding, threshold=PROMPT_DEDUPE_THRESHOLD):
+    """
+        Order summaries by similarity to the channel and drop near duplicates.
+
+        Parameters:
+        - embeddings (array): One embedding per summary.
+        - query_embedding (array): Embedding describing the channel.
+        - threshold (float): Cosine similarity above which a summary repeats an earlier one.
+
+        Returns:
+        - order (list): Indices of the summaries to keep, most relevant first.
+    """
+    points = normalize(embeddings)
+    if not len(points):
+        return []
+    relevance = points @ normalize(np.asarray(query_embedding)[None, :])[0]
+
+    order = []
+    for index in np.argsort(-relevance, kind='stable'):
+        if order and np.max(points[order] @ points[index]) > threshold:
+            continue
+        order.append(int(index))
+    return order
+
+
+@traced()
+def build_video_description(summaries, embeddings, query_embedding, count_tokens, budget=None):
+    """
+        Fill the video list of the prompt with as many distinct summaries as the context allows.
+
+        Parameters:
+        - summaries (list): Summaries of similar and representative videos.
+        - embeddings (array): One embedding per summary.
+        - query_embedding (array): Embedding describing the channel.
+        - count_tokens (callable): Token counts of the generation model for a list of texts.
+        - budget (int): Tokens available for the list, by default the context minus template and output.
+
+        Returns:
+        - description (str): One numbered line per summary, most relevant first.
+    """
+    budget = prompt_budget(count_tokens) if budget is None else budget
+    order = rank_summaries(embeddings, query_embedding)
+    if not order:
+        return ''
+
+    # Labels and summaries are counted in one call instead of one call per line
+    labels = [f"Video {number} : " for number in range(1, len(order) + 1)]
+    bodies = [f"{summaries[index]}. \n" for index in order]
+    costs = count_tokens(labels + bodies)
+    label_costs, body_costs = costs[:len(order)], costs[len(order):]
+
+    lines = []
+    used = 0
+    for body, body_cost in zip(bodies, body_costs):
+        cost = label_costs[len(lines)] + body_cost
+        # Longer summaries that do not fit are skipped, shorter ones further down may still fit
+        if used + cost > budget:
+            continue
+        lines.append(labels[len(lines)] + body)
+        used += cost
+
+    # Pieces counted apart can differ by a token where they are joined, so the result is checked once
+    while lines and count_tokens([''.join(lines)])[0] > budget:
+        lines.pop()
+    return ''.join(lines)
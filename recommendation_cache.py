@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from constants import (RECOMMENDATION_CACHE_PATH, RECOMMENDATION_TTL, RECOMMENDATION_CACHE_MAX_ENTRIES,
+                       RECOMMENDATION_REUSE_THRESHOLD)
+from content_cache import normalize_text
+from representatives import normalize
+
+
+def recommendation_key(video_description, scope):
+    return hashlib.sha256(f'{scope}\0{normalize_text(video_description)}'.encode('utf-8')).hexdigest()
+
+
+class RecommendationCache:
+    """
+        Generated recommendations keyed on the assembled video description, the model and the prompt.
+
+        A request whose description is new can still reuse a cached answer from the same scope
+        when the embeddings of the two descriptions are at least reuse_threshold similar.
+
+        Parameters:
+        - path (str): Location of the SQLite database file.
+        - ttl (float): Seconds a recommendation is reused for.
+        - max_entries (int): Least recently used entries are evicted beyond this size.
+        - reuse_threshold (float): Cosine similarity for near-duplicate reuse, 0 to only reuse exact matches.
+    """
+
+    def __init__(self, path=RECOMMENDATION_CACHE_PATH, ttl=RECOMMENDATION_TTL,
+                 max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES, reuse_threshold=RECOMMENDATION_REUSE_THRESHOLD):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.reuse_threshold = reuse_threshold
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS recommendations (
+            key TEXT PRIMARY KEY, scope TEXT NOT NULL, text TEXT NOT NULL, embedding BLOB,
+            created_at REAL NOT NULL, accessed_at REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS recommendations_accessed ON recommendations (accessed_at)')
+        self._conn.commit()
+
+    def _touch(self, key, now):
+        self._conn.execute('UPDATE recommendations SET accessed_at = ? WHERE key = ?', (now, key))
+        self._conn.commit()
+
+    def get(self, video_description, scope, embedding=None):
+        """
+            Look up a recommendation for a description.
+
+            Parameters:
+            - video_description (str): The video list that would be put into the prompt.
+            - scope (str): Model and prompt version, answers from another scope are never reused.
+            - embedding (array): Embedding of the description, enables near-duplicate reuse.
+
+            Returns:
+            - text (str): The cached recommendation, or None.
+        """
+        key = recommendation_key(video_description, scope)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT text FROM recommendations WHERE key = ? AND created_at > ?',
+                                     (key, now - self.ttl)).fetchone()
+            if row is not None:
+                self._touch(key, now)
+                self.counters['hits'] += 1
+                return row[0]
+
+            if self.reuse_threshold and embedding is not None:
+                rows = self._conn.execute(
+                    'SELECT key, text, embedding FROM recommendations WHERE scope = ? AND created_at > ? '
+                    'AND embedding IS NOT NULL', (scope, now - self.ttl)).fetchall()
+                if rows:
+                    matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, _, blob in rows])
+                    query = normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+                    similarities = matrix @ query
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.reuse_threshold:
+                        self._touch(rows[best][0], now)
+                        self.counters['near_duplicate_hits'] += 1
+                        return rows[best][1]
+
+            self.counters['misses'] += 1
+            return None
+
+    def set(self, video_description, scope, text, embedding=None):
+        key = recommendation_key(video_description, scope)
+        blob = None
+        if embedding is not None:
+            blob = normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0].tobytes()
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?, ?, ?)',
+                               (key, scope, text, blob, now, now))
+            self._conn.execute('DELETE FROM recommendations WHERE created_at <= ?', (now - self.ttl,))
+            count = self._conn.execute('SELECT COUNT(*) FROM recommendations').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM recommendations WHERE key IN '
+                    '(SELECT key FROM recommendations ORDER BY accessed_at LIMIT ?)', (count - self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        return dict(self.counters)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM recommendations')
+            self._conn.commit()
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,98 @@
+import numpy as np
+
+from constants import NUM_REPRESENTATIVES, REPRESENTATIVE_METHOD, MMR_LAMBDA
+from tracing import traced
+
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def squared_distances(points, centers):
+    # ||p - c||^2 = ||p||^2 - 2 p.c + ||c||^2 for every pair in one matrix product
+    distances = (np.einsum('ij,ij->i', points, points)[:, None]
+                 - 2 * points @ centers.T
+                 + np.einsum('ij,ij->i', centers, centers)[None, :])
+    return np.maximum(distances, 0)
+
+
+def closest_to_centroids(centroids, embeddings):
+    # A distinct embedding per centroid, minimizing the total distance when two centroids share a nearest point.
+    from scipy.optimize import linear_sum_assignment
+
+    rows, columns = linear_sum_assignment(squared_distances(np.asarray(embeddings), np.asarray(centroids)))
+    return [int(index) for index in rows[np.argsort(columns)]]
+
+
+def _kmeans(embeddings, k, random_state):
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=k, n_init=1, random_state=random_state).fit(embeddings)
+    return closest_to_centroids(kmeans.cluster_centers_, embeddings)
+
+
+def _minibatch_kmeans(embeddings, k, random_state):
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=k, n_init=1, random_state=random_state,
+                             batch_size=min(1024, len(embeddings))).fit(embeddings)
+    return closest_to_centroids(kmeans.cluster_centers_, embeddings)
+
+
+def _k_center(embeddings, k, random_state):
+    # Greedy farthest-point traversal over normalized embeddings, starting next to the mean.
+    points = normalize(embeddings)
+    selected = [int(np.argmax(points @ normalize(points.mean(axis=0, keepdims=True))[0]))]
+    distances = 1 - points @ points[selected[0]]
+    for _ in range(k - 1):
+        # Identical embeddings are all at distance 0, picked points must not be chosen again
+        distances[selected] = -np.inf
+        index = int(np.argmax(distances))
+        selected.append(index)
+        distances = np.minimum(distances, 1 - points @ points[index])
+    return selected
+
+
+def _mmr(embeddings, k, random_state, diversity=MMR_LAMBDA):
+    # Maximal marginal relevance: relevance to the channel mean traded off against redundancy.
+    points = normalize(embeddings)
+    relevance = points @ normalize(points.mean(axis=0, keepdims=True))[0]
+    selected = [int(np.argmax(relevance))]
+    max_similarity = points @ points[selected[0]]
+    for _ in range(k - 1):
+        scores = (1 - diversity) * relevance - diversity * max_similarity
+        scores[selected] = -np.inf
+        index = int(np.argmax(scores))
+        selected.append(index)
+        max_similarity = np.maximum(max_similarity, points @ points[index])
+    return selected
+
+
+METHODS = {
+    'kmeans': _kmeans,
+    'minibatch': _minibatch_kmeans,
+    'kcenter': _k_center,
+    'mmr': _mmr,
+}
+
+
+@traced()
+def select_representatives(embeddings, k=NUM_REPRESENTATIVES, method=REPRESENTATIVE_METHOD, random_state=0):
+    """
+        Pick up to k embeddings that together cover the content of a channel.
+
+        Parameters:
+        - embeddings (array): One row per video.
+        - k (int): Number of representatives, reduced when there are fewer videos.
+        - method (str): 'kmeans', 'minibatch', 'kcenter' or 'mmr'.
+
+        Returns:
+        - indices (list): Row indices of the representatives.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n = len(embeddings)
+    if n <= k:
+        return list(range(n))
+    return METHODS[method](embeddings, k, random_state)
\ No newline at end of file
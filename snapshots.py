@@ -0,0 +1,193 @@
+import io
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import SNAPSHOT_DIR, SNAPSHOT_CHANNELS
+from content_cache import LRUCache
+from tracing import traced
+
+METRICS = ('Views', 'Likes', 'Comments')
+# Counts hidden by the uploader are stored as -1 and read back as nulls
+MISSING = -1
+_HEADER = struct.Struct('<I')
+
+
+def _encode(fetched_at, video_ids, values):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, fetched_at=np.float64(fetched_at), video_ids=np.asarray(video_ids, dtype=str),
+                        values=values)
+    data = buffer.getvalue()
+    return _HEADER.pack(len(data)) + data
+
+
+def _decode(path, offset=0):
+    # Yields (offset after the record, record) for every complete record from offset on
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            data = f.read(_HEADER.unpack(header)[0])
+            # A record cut short by a crash is the end of the log
+            if len(data) < _HEADER.unpack(header)[0]:
+                return
+            with np.load(io.BytesIO(data)) as record:
+                yield f.tell(), (float(record['fetched_at']), record['video_ids'], record['values'])
+
+
+class _ChannelLog:
+    # Records of one channel read so far, where reading stopped and the last values of every video
+    def __init__(self):
+        self.records = []
+        self.offset = 0
+        self.latest = {}
+
+
+class SnapshotStore:
+    """
+        Append-only log of per-video statistics, one compressed columnar record per fetch.
+
+        A record only holds the videos whose Views, Likes or Comments changed since the
+        previous record of the channel, so a daily refresh writes a few kilobytes.
+        Decoded records are kept for the most recently used channels only, and later reads
+        only decode what was appended since.
+
+        Parameters:
+        - directory (str): One <channel_id>.snap file per channel is kept here.
+        - max_channels (int): Number of channels whose decoded log is kept in memory.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, max_channels=SNAPSHOT_CHANNELS):
+        self.directory = directory
+        self._logs = LRUCache(max_channels)
+        self._lock = threading.Lock()
+
+    def _path(self, channel_id):
+        return os.path.join(self.directory, f'{channel_id}.snap')
+
+    def _read(self, channel_id):
+        # Decodes the records appended since the last read, by this or another process
+        path = self._path(channel_id)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        log = self._logs.get(channel_id)
+        # A log that was removed or rewritten since is read again from the start
+        if log is None or size < log.offset:
+            log = _ChannelLog()
+            self._logs.set(channel_id, log)
+        if size > log.offset:
+            for offset, record in _decode(path, log.offset):
+                log.records.append(record)
+                log.latest.update(zip(record[1].tolist(), map(tuple, record[2].tolist())))
+                log.offset = offset
+        return log
+
+    @traced('snapshots.append')
+    def append(self, channel_id, videos, fetched_at=None):
+        """
+            Record the statistics of a freshly built video frame.
+
+            Parameters:
+            - channel_id (str): The channel the videos belong to.
+            - videos (DataFrame): Frame with Video_id and the Views, Likes and Comments columns.
+            - fetched_at (float): Unix time of the fetch, now by default.
+
+            Returns:
+            - changed (int): Number of videos written to the log.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        values = np.column_stack([videos[metric].to_numpy(dtype=np.int64, na_value=MISSING) for metric in METRICS]) \
+            if len(videos) else np.zeros((0, len(METRICS)), dtype=np.int64)
+        video_ids = videos['Video_id'].tolist()
+
+        with self._lock:
+            latest = self._read(channel_id).latest
+            previous = np.array([latest.get(video_id, (MISSING - 1,) * len(METRICS)) for video_id in video_ids],
+                                dtype=np.int64).reshape(-1, len(METRICS))
+            changed = np.flatnonzero((values != previous).any(axis=1))
+            if not len(changed):
+                return 0
+
+            changed_ids = [video_ids[i] for i in changed]
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(channel_id), 'ab') as f:
+                f.write(_encode(fetched_at, changed_ids, values[changed]))
+            # The record is decoded back by the next read, which keeps the offset in step with the file
+            self._read(channel_id)
+            return len(changed)
+
+    def history(self, channel_id):
+        """
+            All recorded changes of a channel.
+
+            Returns:
+            - history (DataFrame): Video_id, Fetched_at (UTC) and one nullable Int64 column per metric.
+        """
+        with self._lock:
+            records = list(self._read(channel_id).records)
+        if not records:
+            return pd.DataFrame({'Video_id': pd.Series(dtype=object), 'Fetched_at': pd.Series(dtype='datetime64[ns, UTC]'),
+                                 **{metric: pd.Series(dtype='Int64') for metric in METRICS}})
+
+        values = np.concatenate([record[2] for record in records])
+        history = pd.DataFrame({
+            'Video_id': np.concatenate([record[1] for record in records]).astype(object),
+            'Fetched_at': pd.to_datetime(np.repeat([record[0] for record in records],
+                                                   [len(record[1]) for record in records]), unit='s', utc=True),
+        })
+        for i, metric in enumerate(METRICS):
+            history[metric] = pd.arrays.IntegerArray(values[:, i], values[:, i] == MISSING)
+        return history
+
+
+@traced()
+def growth(history, videos=None, top=10):
+    """
+        Channel growth and per-video velocity from the snapshot history, without per-video loops.
+
+        Parameters:
+        - history (DataFrame): Output of SnapshotStore.history().
+        - videos (DataFrame): Current video frame, used to title the fastest growing videos.
+        - top (int): Number of videos in the velocity ranking.
+
+        Returns:
+        - channel (DataFrame): Per snapshot, the channel totals and their gain per day since the previous one.
+        - velocity (DataFrame): Views gained per day between the last two snapshots, fastest videos first.
+    """
+    seconds = (history['Fetched_at'] - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+    times, time_codes = np.unique(seconds, return_inverse=True)
+    video_codes, video_ids = pd.factorize(history['Video_id'])
+
+    channel = {'Fetched_at': pd.to_datetime(times, unit='s', utc=True)}
+    days = np.diff(times) / 86400
+    velocity = None
+    for metric in METRICS:
+        # Time x video matrix of the latest known value, carried forward between changes
+        matrix = np.full((len(times), len(video_ids)), np.nan)
+        matrix[time_codes, video_codes] = history[metric].to_numpy(dtype=float, na_value=np.nan)
+        matrix = pd.DataFrame(matrix).ffill().to_numpy()
+
+        totals = np.nansum(matrix, axis=1)
+        channel[metric] = totals
+        channel[f'{metric}_per_day'] = np.concatenate([[np.nan] * min(len(times), 1), np.diff(totals) / np.maximum(days, 1e-9)])
+
+        if metric == 'Views' and len(times) > 1:
+            velocity = (matrix[-1] - matrix[-2]) / max(days[-1], 1e-9)
+
+    channel = pd.DataFrame(channel)
+    if velocity is None:
+        return channel, pd.DataFrame({'Video_id': [], 'Title': [], 'Views_per_day': []})
+
+    order = np.argsort(-np.nan_to_num(velocity, nan=-np.inf), kind='stable')[:top]
+    ranking = pd.DataFrame({'Video_id': np.asarray(video_ids)[order], 'Views_per_day': velocity[order]})
+    titles = videos.set_index('Video_id')['Title'] if videos is not None else pd.Series(dtype=object)
+    ranking.insert(1, 'Title', ranking['Video_id'].map(titles))
+    return channel, ranking.dropna(subset=['Views_per_day']).reset_index(drop=True)
+
+
+snapshot_store = SnapshotStore()
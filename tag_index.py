@@ -0,0 +1,153 @@
+import threading
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from constants import TAG_INDEX_CHANNELS, TAG_CLUSTER_THRESHOLD
+from content_cache import LRUCache
+from tracing import traced
+
+
+class TagIndex:
+    """
+        Tags of a channel's videos as an integer vocabulary and a sparse video x tag matrix.
+
+        Videos are added incrementally, a video that is already indexed keeps its tags.
+        Counts, co-occurrences and clusters are computed from the matrix, so queries do not
+        walk the Tags column again.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.tags = []
+        self.video_ids = []
+        self._positions = {}
+        self._indptr = array('q', [0])
+        self._indices = array('q')
+        self._matrix = None
+        self._cooccurrence = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    @traced('tag_index.add')
+    def add(self, video_ids, tags):
+        with self._lock:
+            added = 0
+            for video_id, video_tags in zip(video_ids, tags):
+                if video_id in self._positions:
+                    continue
+                self._positions[video_id] = len(self.video_ids)
+                self.video_ids.append(video_id)
+                codes = set()
+                for tag in video_tags:
+                    code = self.vocabulary.get(tag)
+                    if code is None:
+                        code = self.vocabulary[tag] = len(self.tags)
+                        self.tags.append(tag)
+                    codes.add(code)
+                self._indices.extend(sorted(codes))
+                self._indptr.append(len(self._indices))
+                added += 1
+            if added:
+                self._matrix = None
+                self._cooccurrence = None
+            return added
+
+    @property
+    def matrix(self):
+        matrix = self._matrix
+        if matrix is None:
+            with self._lock:
+                indices = np.frombuffer(self._indices, dtype=np.int64).copy()
+                matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices,
+                                            np.frombuffer(self._indptr, dtype=np.int64).copy()),
+                                           shape=(len(self.video_ids), len(self.tags)))
+                self._matrix = matrix
+        return matrix
+
+    def _rows(self, video_ids):
+        return np.fromiter((self._positions[video_id] for video_id in video_ids if video_id in self._positions),
+                           dtype=np.int64)
+
+    def counts(self, video_ids=None):
+        # Number of videos using each tag, optionally restricted to some of the videos
+        matrix = self.matrix if video_ids is None else self.matrix[self._rows(video_ids)]
+        return np.asarray(matrix.sum(axis=0)).ravel()
+
+    def top_tags(self, k=50, video_ids=None):
+        counts = self.counts(video_ids)
+        # Ties keep the order in which tags were first seen, like Counter.most_common
+        order = np.argsort(-counts, kind='stable')[:k]
+        return [(self.tags[i], int(counts[i])) for i in order if counts[i] > 0]
+
+    @property
+    def cooccurrence(self):
+        # Tag x tag matrix of the number of videos using both tags
+        cooccurrence = self._cooccurrence
+        if cooccurrence is None:
+            matrix = self.matrix
+            cooccurrence = (matrix.T @ matrix).tocsr()
+            self._cooccurrence = cooccurrence
+        return cooccurrence
+
+    def related(self, tag, k=10):
+        if tag not in self.vocabulary:
+            return []
+        code = self.vocabulary[tag]
+        row = self.cooccurrence.getrow(code).toarray().ravel()
+        row[code] = 0
+        order = np.argsort(-row, kind='stable')[:k]
+        return [(self.tags[i], int(row[i])) for i in order if row[i] > 0]
+
+    def clusters(self, k=30, threshold=TAG_CLUSTER_THRESHOLD, video_ids=None):
+        """
+            Group the k most used tags by how often they appear together.
+
+            Parameters:
+            - k (int): Number of top tags to cluster.
+            - threshold (float): Minimum association, co-occurrences / sqrt(count a * count b), to join a cluster.
+            - video_ids (iterable): Restrict the counts to these videos.
+
+            Returns:
+            - clusters (list): Lists of tags, the most used cluster first.
+        """
+        matrix = self.matrix if video_ids is None else self.matrix[self._rows(video_ids)]
+        counts = np.asarray(matrix.sum(axis=0)).ravel()
+        top = [i for i in np.argsort(-counts, kind='stable')[:k] if counts[i] > 0]
+        if not top:
+            return []
+
+        columns = matrix[:, top]
+        together = (columns.T @ columns).toarray().astype(float)
+        frequency = np.sqrt(np.diag(together))
+        association = together / np.maximum(np.outer(frequency, frequency), 1e-12)
+
+        # Greedy: each tag joins the seed it is most associated with, or starts a new cluster
+        seeds, clusters = [], []
+        for position in range(len(top)):
+            if seeds:
+                scores = association[position, seeds]
+                best = int(np.argmax(scores))
+                if scores[best] >= threshold:
+                    clusters[best].append(self.tags[top[position]])
+                    continue
+            seeds.append(position)
+            clusters.append([self.tags[top[position]]])
+        return clusters
+
+
+_indexes = LRUCache(TAG_INDEX_CHANNELS)
+_indexes_lock = threading.Lock()
+
+
+def get_tag_index(channel_id):
+    # One index per channel, kept for the most recently analysed channels
+    with _indexes_lock:
+        index = _indexes.get(channel_id)
+        if index is None:
+            index = TagIndex()
+            _indexes.set(channel_id, index)
+        return index
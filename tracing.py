@@ -0,0 +1,206 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from key_manager import key_manager
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, traces then have no peak RSS figure
+    resource = None
+
+logger = logging.getLogger('tracing')
+
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, name, parent, depth):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.end = None
+        # Peak Python allocations above the start of the span, only measured while tracemalloc is tracing
+        self.peak_memory = None
+        self._baseline = 0
+        self._peak_seen = 0
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Trace:
+    """
+        Span timings and counters collected for one request on the thread that opened it.
+
+        Counters cover API calls and quota units per key, token counts and cache hits;
+        memory figures are taken when the trace is finished.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.counters = Counter()
+        self.quota_by_key = Counter()
+        self.quota_by_endpoint = Counter()
+        self.peak_rss_bytes = None
+        self.gpu_peak_bytes = None
+        self._stack = []
+
+    @contextmanager
+    def span(self, name):
+        parent = self._stack[-1] if self._stack else None
+        span = Span(name, parent.name if parent else None, len(self._stack))
+        measure_memory = tracemalloc.is_tracing()
+        if measure_memory:
+            # The peak is reset for every span, so the parent keeps the highest peak seen before it
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent._peak_seen = max(parent._peak_seen, peak)
+            tracemalloc.reset_peak()
+            span._baseline = span._peak_seen = current
+        self.spans.append(span)
+        self._stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._stack.pop()
+            if measure_memory:
+                peak = max(span._peak_seen, tracemalloc.get_traced_memory()[1])
+                span.peak_memory = peak - span._baseline
+                if parent is not None:
+                    parent._peak_seen = max(parent._peak_seen, peak)
+
+    def add_span(self, name, start, end):
+        span = Span(name, self._stack[-1].name if self._stack else None, len(self._stack))
+        span.start, span.end = start, end
+        self.spans.append(span)
+
+    def rows(self):
+        return [{'span': '  ' * span.depth + span.name, 'seconds': round(span.duration, 4)} for span in self.spans]
+
+    def as_dict(self):
+        return {
+            'trace': self.name,
+            'spans': [{'name': span.name, 'parent': span.parent, 'seconds': span.duration} for span in self.spans],
+            'counters': dict(self.counters),
+            'quota_units_by_key': dict(self.quota_by_key),
+            'quota_units_by_endpoint': dict(self.quota_by_endpoint),
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'gpu_peak_bytes': self.gpu_peak_bytes,
+        }
+
+    def to_log(self):
+        return json.dumps(self.as_dict())
+
+    def to_openmetrics(self):
+        lines = ['# TYPE pipeline_span_seconds gauge']
+        for span in self.spans:
+            lines.append(f'pipeline_span_seconds{{trace="{self.name}",span="{span.name}"}} {span.duration:.6f}')
+        lines.append('# TYPE pipeline_events counter')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'pipeline_events_total{{trace="{self.name}",event="{name}"}} {value}')
+        lines.append('# TYPE youtube_api_quota_units counter')
+        for key, value in sorted(self.quota_by_key.items()):
+            lines.append(f'youtube_api_quota_units_total{{trace="{self.name}",key="{key}"}} {value}')
+        if self.peak_rss_bytes is not None:
+            lines.append('# TYPE process_peak_rss_bytes gauge')
+            lines.append(f'process_peak_rss_bytes {self.peak_rss_bytes}')
+        if self.gpu_peak_bytes is not None:
+            lines.append('# TYPE gpu_peak_memory_bytes gauge')
+            lines.append(f'gpu_peak_memory_bytes {self.gpu_peak_bytes}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def _finish(self, usage, cache_counters):
+        self.counters['api_calls'] += usage.calls
+        self.counters['quota_units'] += usage.units
+        self.quota_by_key.update(usage.units_by_key)
+        self.quota_by_endpoint.update(usage.units_by_endpoint)
+        self.counters.update({name: value for name, value in cache_counters.items() if value})
+
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        if resource is not None:
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_rss_bytes = peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+        # Only look at the GPU when torch is already loaded, tracing must not import it
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            self.gpu_peak_bytes = torch.cuda.max_memory_allocated()
+
+
+def _cache_counters():
+    from cache import metadata_cache
+    from content_cache import content_cache
+    from recommendation_cache import recommendation_cache
+
+    counters = Counter({f'content_cache_{name}': value for name, value in content_cache.stats().items()})
+    counters.update({f'metadata_cache_{name}': value for name, value in metadata_cache.stats().items()})
+    counters.update({f'recommendation_cache_{name}': value for name, value in recommendation_cache.stats().items()})
+    return counters
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def trace_request(name):
+    """Trace everything called on this thread inside the block; the trace is logged when it ends."""
+    trace = Trace(name)
+    _local.trace = trace
+    cache_before = _cache_counters()
+    try:
+        with key_manager.track() as usage, trace.span(name):
+            yield trace
+    finally:
+        _local.trace = None
+        cache_after = _cache_counters()
+        cache_after.subtract(cache_before)
+        trace._finish(usage, cache_after)
+        logger.info(trace.to_log())
+        if os.getenv('TRACE_OPENMETRICS_PATH'):
+            with open(os.getenv('TRACE_OPENMETRICS_PATH'), 'w') as f:
+                f.write(trace.to_openmetrics())
+
+
+def traced(name=None):
+    # Records a span when a trace is active on the calling thread, costs one attribute lookup otherwise
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = current_trace()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with trace.span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(counter, value=1):
+    trace = current_trace()
+    if trace is not None:
+        trace.counters[counter] += value
+
+
+def record_span(name, start, end):
+    trace = current_trace()
+    if trace is not None:
+        trace.add_span(name, start, end)
\ No newline at end of file
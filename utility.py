@@ -1,305 +1,382 @@
-import torch
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-
 from langchain_core.output_parsers import StrOutputParser
 
 import pycountry
 
-from datetime import datetime, timedelta
-
-import pandas as pd
-
-import requests
+from datetime import datetime, timedelta, timezone
 
-from models import summarizer, generator, tokenizer
+import models
 from prompt import prompts
 
-from constants import APIS, BASE_URL
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from api_client import YouTubeAPIError, api_get, chunked
+from key_manager import key_manager
+from cache import metadata_cache
+from categories import category_registry
+from content_cache import cached_summaries, cached_embeddings
+from video_frame import VideoFrameBuilder
+from constants import (SUMMARY_BATCH_SIZE, MAX_NEW_TOKENS, INFERENCE_BATCHING, SIMILAR_VIDEOS,
+                       SIMILAR_MIN_SCORE, SEARCH_TAGS, MAX_API_WORKERS, MEMORY_LIMIT_MB, GENERATION_BACKEND,
+                       LLAMA_CPP_MODEL_PATH)
+from vector_index import video_index
+from batching import get_inference_worker
+from generation import generate_stream
+from prompt_builder import template_parts, prompt_version
+from recommendation_cache import recommendation_cache
+from tracing import traced, record, record_span
 
-import numpy as np
 import re
+import time
 
-import calendar
-
+@traced()
 def get_channel_info(channel_id):
-    current_api_key_index = 0
-    while current_api_key_index < len(APIS):
-        try:
-            youtube = build('youtube', 'v3', developerKey=APIS[current_api_key_index])
-            response = youtube.channels().list(part='snippet,contentDetails,statistics',
-                    id=channel_id).execute()
+    response = metadata_cache.get('channel', channel_id)
+    if response is not None:
+        return response
 
-            return response
-        except HttpError as e:
-            print('An HTTP error occurred:', e)
-        current_api_key_index += 1
+    try:
+        response = api_get('channels', {'part': 'snippet,contentDetails,statistics', 'id': channel_id})
+    except YouTubeAPIError as e:
+        print('An HTTP error occurred:', e)
+        return None
 
+    metadata_cache.set('channel', channel_id, response)
     return response
 
-def get_video_details(content_details):
-    current_api_key_index = 0
-    while current_api_key_index < len(APIS):
-        try:
-            youtube = build('youtube', 'v3', developerKey=APIS[current_api_key_index])
-            request_ = youtube.playlistItems().list(part='snippet,contentDetails',
-                    playlistId=content_details['relatedPlaylists']['uploads'],maxResults=50)
+def iter_video_id_pages(content_details):
+    """
+        Page through the uploads playlist of a channel, yielding the video IDs of each page as it arrives.
+
+        The uploads playlist is ordered newest first, so paging stops at the first video already in the
+        cached playlist and the rest is yielded from the cache. A page that still fails after the
+        retries in api_get ends the listing early, and the incomplete playlist is not cached.
 
-            video_details = request_.execute()
-        except:
-            video_details = None
+        Parameters:
+        - content_details (dict): The contentDetails of the channel.
 
-        if video_details is not None:
+        Returns:
+        - pages (generator): Lists of at most 50 video IDs, newest first.
+    """
+    playlist_id = content_details['relatedPlaylists']['uploads']
+    cached_ids, fresh = metadata_cache.get_entry('playlist', playlist_id)
+    if fresh:
+        yield from chunked(cached_ids)
+        return
+
+    known_ids = set(cached_ids or [])
+    new_ids = []
+    complete = False
+    params = {'part': 'contentDetails', 'maxResults': 50, 'playlistId': playlist_id}
+
+    # Due to youtube data api limit, the following logic is necessary to take more than 50 videos of user
+    while not complete:
+        start = time.perf_counter()
+        try:
+            video_details = api_get('playlistItems', params)
+        except Exception as e:
+            print('An error occurred while paging the uploads playlist:', e)
             break
+        finally:
+            record_span('playlist_paging', start, time.perf_counter())
+
+        page = []
+        for item in video_details['items']:
+            video_id = item['contentDetails']['videoId']
+            if video_id in known_ids:
+                complete = True
+                break
+            page.append(video_id)
 
-        current_api_key_index += 1
-    
-    if video_details is not None:
-        # Taking all video id for specific information about each video
-        video_ids = []
-        for i in range(len(video_details['items'])):
-            video_ids.append(video_details['items'][i]['contentDetails']['videoId'])
+        new_ids.extend(page)
+        if page:
+            yield page
 
-        next_page_token = video_details.get('nextPageToken', '')
+        next_page_token = video_details.get('nextPageToken')
+        if not next_page_token:
+            complete = True
+        params = {**params, 'pageToken': next_page_token}
 
-    if next_page_token:
-        more_pages = True
-    else:
-        more_pages = False
+    seen = set(new_ids)
+    remaining_ids = [video_id for video_id in cached_ids or [] if video_id not in seen]
+    yield from chunked(remaining_ids)
+    if complete:
+        metadata_cache.set('playlist', playlist_id, new_ids + remaining_ids)
 
-    # Due to youtube data api limit, the following logic is necessary to take more than 50 videos of user
-    while more_pages:
-        if next_page_token:
-            request_ = youtube.playlistItems().list(part='contentDetails,snippet,status',
-                    playlistId=content_details['relatedPlaylists']['uploads'],maxResults=50,
-                    pageToken=next_page_token)
-            try:
-                video_details = request_.execute()
 
-                for i in range(len(video_details['items'])):
-                    video_ids.append(video_details['items'][i]['contentDetails']['videoId'])
-                next_page_token = video_details.get('nextPageToken', "end")
+@traced()
+def get_video_details(content_details):
+    return [video_id for page in iter_video_id_pages(content_details) for video_id in page]
 
-                if next_page_token == "end":
-                    break
-            except:
-                pass
 
-    return video_ids
+def _fetch_video_page(video_ids):
+    # Only statistics that are missing or stale in the cache are fetched again
+    cached_videos = metadata_cache.get_many('video', video_ids)
+    stale_ids = [video_id for video_id in video_ids if video_id not in cached_videos]
+    if stale_ids:
+        try:
+            response = api_get('videos', {'part': 'snippet,statistics', 'id': ','.join(stale_ids)})
+            fetched_videos = {video['id']: video for video in response.get('items', [])}
+            metadata_cache.set_many('video', fetched_videos)
+            cached_videos.update(fetched_videos)
+        except Exception as e:
+            print('An error occurred while fetching video statistics:', e)
+    return [cached_videos[video_id] for video_id in video_ids if video_id in cached_videos]
 
-def get_video_statistics(video_ids):
-    # Getting videos statistics
-    all_video_details = []
-    if video_ids is not None:
-        current_api_key_index = 0
-        while current_api_key_index < len(APIS):
-            try:
-                for i in range(0, len(video_ids), 50):
-                    params = {'part': 'snippet,statistics',
-                        'id': ','.join(video_ids[i:i + 50]),'key': APIS[current_api_key_index]}
-
-                    response = requests.get(f'{BASE_URL}/videos', params=params)
-                    video_details = response.json()
-                    if "items" in video_details:
-                        for video in video_details['items']:
-                            tags = []
-                            defaultLanguage = None
-                            audioLanguage = None
-                            likeCount = 0
-                            viewCount = 0
-
-                            if "defaultLanguage" in video['snippet']:
-                                default_language = video['snippet']['defaultLanguage']
-
-                            if "tags" in video['snippet']:
-                                tags = video['snippet']['tags']
-
-                            if "likeCount" in video['statistics']:
-                                like_count = video['statistics']['likeCount']
-
-                            if "viewCount" in video['statistics']:
-                                view_count = video['statistics']['viewCount']
-
-                            if "commentCount" in video['statistics']:
-                                comment_count = video['statistics']['commentCount']
-
-                            if 'defaultAudioLanguage' in video['snippet']:
-                                audio_language = video['snippet']['defaultAudioLanguage']
-
-                            category_id = video['snippet']['categoryId']
-
-                            video_stats = dict(Title=video['snippet']['title'],
-                                Published_date=video['snippet']['publishedAt'],Default_language=default_language,
-                                Views=view_count,Likes=like_count,Comments=comment_count,
-                                Category_id=category_id,Tags=tags,
-                                Description=video['snippet']['description'],Audio_language=audio_language)
-
-                            all_video_details.append(video_stats)
-                break
-            except:
-                pass
-                current_api_key_index += 1
-                
-        all_video_details = pd.DataFrame(all_video_details)
-    else:
-        all_video_details = None
 
-    return all_video_details
+def iter_video_pages(id_pages, max_in_flight=MAX_API_WORKERS):
+    """
+        Fetch the statistics of each page of video IDs while later pages are still being listed.
 
-def get_category(top_category_ids):
-    top_category = dict()
-    reverse_category = dict()
-    for i in range(0, len(top_category_ids), 50):
-        category_ids_batch = ','.join(top_category_ids[i:i + 50])
-
-        # Make the request to retrieve information about multiple videos
-        if category_ids_batch:
-            current_api_key_index = 0
-            while current_api_key_index < len(APIS):
-                try:
-                    current_api_key = APIS[current_api_key_index]
-                    params = {
-                        'part': 'snippet',
-                        'id': category_ids_batch,
-                        'key': current_api_key
-                    }
-        
-                    response = requests.get(f'{BASE_URL}/videoCategories', params=params)
-                    response.raise_for_status()
-                    data = response.json()
-                    break
-                except Exception as e:
-                    data = None
-        
-                current_api_key_index += 1
-        
-                if current_api_key_index == len(APIS):
-                    Text = "API IS OUT OF ORDER FOR TODAY"
-        
-            # Process and print the video category data
-            if 'items' in data:
-                for video in data['items']:
-                    top_category[video['id']] = video['snippet']['title']
-                    reverse_category[video['snippet']['title']] = video['id']
-        else:
-            break
+        At most max_in_flight pages are requested at once and pages are yielded in input order,
+        so memory does not grow with the size of the channel.
 
-    return top_category, reverse_category
+        Parameters:
+        - id_pages (iterable): Lists of at most 50 video IDs.
+        - max_in_flight (int): Pages fetched concurrently.
 
-def get_best_similar_video(tags, category_ids):
+        Returns:
+        - pages (generator): The `videos` resources of each page.
+    """
+    usages = key_manager.current_usages()
+
+    def fetch(video_ids):
+        start = time.perf_counter()
+        with key_manager.attach(usages):
+            videos = _fetch_video_page(video_ids)
+        return videos, start, time.perf_counter()
+
+    def collect(future):
+        # The trace belongs to this thread, so the span of a page is recorded once its result is taken
+        videos, start, end = future.result()
+        record_span('video_statistics', start, end)
+        return videos
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for video_ids in id_pages:
+            pending.append(executor.submit(fetch, video_ids))
+            if len(pending) >= max_in_flight:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+
+@traced()
+def get_channel_videos(content_details, on_page=None, memory_limit=MEMORY_LIMIT_MB * 2 ** 20):
     """
-        Make an API call to retrieve video recommendations based on specified parameters.
+        Stream the uploads of a channel from playlist pages through statistics into a DataFrame.
+
+        Descriptions are left out of the frame, see load_descriptions. Once the frame would take more
+        than memory_limit bytes no further pages are fetched and frame.attrs['truncated'] is set, so
+        only the most recent uploads are kept.
 
         Parameters:
-        - categoryId (str): The category ID of the videos to search for.
-        - start_date (datetime): The start date for filtering video results.
-        - tag (str): The tag or keyword to include in the search query.
-        - country_code (str): The country code for region-based filtering.
+        - content_details (dict): The contentDetails of the channel.
+        - on_page (callable): Called as on_page(videos, loaded) after every page, e.g. to render progress.
+        - memory_limit (int): Ceiling in bytes for the frame, 0 for no limit.
 
         Returns:
-        - result (dict): A dictionary containing video search and details information.
-        - Text (str): Additional information or error message.
+        - all_video_details (DataFrame): One row per video, newest first.
     """
-    months_back = 36
-    today = datetime.now()
-    start_date = today - timedelta(days=30 * months_back)
+    # Rows go straight into typed columns, no per-video dicts or conversion passes afterwards
+    builder = VideoFrameBuilder(descriptions=False)
+    truncated = False
+    for videos in iter_video_pages(iter_video_id_pages(content_details)):
+        builder.add_many(videos)
+        if on_page is not None:
+            on_page(videos, len(builder))
+        if memory_limit and builder.nbytes >= memory_limit:
+            print(f'Stopped after {len(builder)} videos, the video table reached its memory limit')
+            truncated = True
+            break
+
+    all_video_details = builder.build()
+    all_video_details.attrs['truncated'] = truncated
+    return all_video_details
 
-    for category_id in category_ids:
-        current_api_key_index = 0
-        while current_api_key_index < len(APIS):
-            try:
-                current_api_key = APIS[current_api_key_index]
-                youtube = build('youtube', 'v3', developerKey=current_api_key)
 
-                # Perform a video search based on the specified parameters
-                search_response = youtube.search().list(part='snippet',q=tags,order='viewCount',type='video',
-                    videoCategoryId=category_id,maxResults=10).execute()
+@traced()
+def load_descriptions(video_ids):
+    # Descriptions live out of the frame, in the metadata cache, and are only read for the videos that need them
+    video_ids = list(video_ids)
+    entries = metadata_cache.get_many_entries('video', video_ids)
+    videos = {video_id: value for video_id, (value, fresh) in entries.items()}
+    missing_ids = [video_id for video_id in video_ids if video_id not in videos]
+    for batch in chunked(missing_ids):
+        videos.update((video['id'], video) for video in _fetch_video_page(batch))
+    return [videos[video_id]['snippet'].get('description', '') if video_id in videos else ''
+            for video_id in video_ids]
 
-                ids = []
-                for item in search_response['items']:
-                    video_date_str = item['snippet']['publishedAt']
-                    video_date = pd.to_datetime(video_date_str, format='%Y-%m-%dT%H:%M:%SZ')
 
-                    if video_date >= start_date:
-                        ids.append(item['id']['videoId'])
+@traced()
+def get_video_statistics(video_ids):
+    # Getting videos statistics
+    if video_ids is None:
+        return None
+
+    builder = VideoFrameBuilder()
+    for videos in iter_video_pages(chunked(video_ids)):
+        builder.add_many(videos)
+    return builder.build()
 
-                result = youtube.videos().list(
-                    part='snippet,statistics',
-                    id=','.join(ids)
-                ).execute()
+@traced()
+def get_category(top_category_ids):
+    # Titles come from the in-memory category table, the API is only called when it is loaded or refreshed
+    top_category = category_registry.titles(top_category_ids)
+    reverse_category = {title: category_id for category_id, title in top_category.items()}
+    return top_category, reverse_category
 
-                break
-            except Exception as e:
-                result = None
+@traced()
+def get_best_similar_video(tags, category_ids, query_embedding=None, exclude_ids=(), k=SIMILAR_VIDEOS):
+    """
+        Retrieve top-performing videos similar to the channel, from the local index first.
 
-            current_api_key_index += 1
+        The search API (100 units per category) is only used to top the index up when it
+        holds fewer than k sufficiently similar videos.
 
-    video = []
-    for item in result['items']:
-        video.append(item['snippet']['title'] + " \n " + item['snippet']['description'] )
+        Parameters:
+        - tags (list): The most common tags of the channel, the first few are used as search query.
+        - category_ids (iterable): The category IDs of the videos to search for.
+        - query_embedding (array): Embedding describing the channel, e.g. the mean of its top videos.
+        - exclude_ids (iterable): Video IDs of the channel itself.
+        - k (int): Number of similar videos to return.
 
+        Returns:
+        - video (list): Title and description of each similar video.
+        - Text (str): Additional information or error message.
+    """
+    category_ids = list(category_ids)
+    exclude_ids = set(exclude_ids)
     text = None
-    # Check if the API key index exceeded the available keys
-    if current_api_key_index - 1 < len(APIS):
-        text = "API IS OUT OF ORDER FOR TODAY"
 
-    return video,text
+    if query_embedding is not None:
+        hits = video_index.search(query_embedding, k, exclude_ids=exclude_ids, category_ids=category_ids,
+                                  min_score=SIMILAR_MIN_SCORE)
+        if len(hits) >= k:
+            return [hit for _, hit, _ in hits], text
+
+    months_back = 36
+    start_date = datetime.now(timezone.utc) - timedelta(days=30 * months_back)
 
-def inference(video_description):
+    found = {}
+    for category_id in category_ids:
+        try:
+            # Perform a video search based on the specified parameters
+            search_response = api_get('search', {'part': 'snippet', 'q': '|'.join(tags[:SEARCH_TAGS]),
+                                                 'order': 'viewCount', 'type': 'video',
+                                                 'videoCategoryId': category_id, 'maxResults': 10,
+                                                 'publishedAfter': start_date.strftime('%Y-%m-%dT%H:%M:%SZ')})
+
+            ids = [item['id']['videoId'] for item in search_response['items']]
+            if ids:
+                result = api_get('videos', {'part': 'snippet,statistics', 'id': ','.join(ids)})
+                for item in result['items']:
+                    found[item['id']] = item
+        except Exception as e:
+            # Every API key failed for this category
+            text = "API IS OUT OF ORDER FOR TODAY"
+
+    videos = [item for video_id, item in found.items() if video_id not in exclude_ids]
+    video = [item['snippet']['title'] + " \n " + item['snippet']['description'] for item in videos]
+
+    if videos:
+        video_index.add([item['id'] for item in videos], video,
+                        [item['snippet']['categoryId'] for item in videos], encode_texts(video))
+        video_index.save()
+
+    if query_embedding is not None:
+        hits = video_index.search(query_embedding, k, exclude_ids=exclude_ids, category_ids=category_ids)
+        return [hit for _, hit, _ in hits], text
+
+    return video[:k], text
+
+def stream_inference(video_description, max_new_tokens=MAX_NEW_TOKENS):
     input_ = prompts.format(top_video=video_description)
-    
+    generator = models.get_generator()
+    generator.cache_prefix(template_parts()[0])
+    return generate_stream(generator, input_, max_new_tokens)
+
+def recommendation_scope(max_new_tokens=MAX_NEW_TOKENS):
+    model = LLAMA_CPP_MODEL_PATH if GENERATION_BACKEND == 'llama_cpp' else models.model_id
+    return f'{GENERATION_BACKEND}:{model}:{prompt_version()}:{max_new_tokens}'
+
+@traced()
+def lookup_recommendation(video_description, embedding=None, max_new_tokens=MAX_NEW_TOKENS):
+    # embedding describes the whole description and enables near-duplicate reuse
+    return recommendation_cache.get(video_description, recommendation_scope(max_new_tokens), embedding)
+
+def store_recommendation(video_description, model_output, embedding=None, max_new_tokens=MAX_NEW_TOKENS):
+    # Failed or empty generations are never cached
+    if model_output:
+        recommendation_cache.set(video_description, recommendation_scope(max_new_tokens), model_output, embedding)
+
+@traced()
+def inference(video_description, max_new_tokens=MAX_NEW_TOKENS, refresh=False, embedding=None,
+              batching=INFERENCE_BATCHING):
+    if not refresh:
+        cached = lookup_recommendation(video_description, embedding, max_new_tokens)
+        if cached is not None:
+            return cached
+
     try:
-        recommendations = generator(
-            input_,
-            max_length=2000,
-            num_return_sequences=1,
-            pad_token_id=tokenizer.eos_token_id
-        )
-        return recommendations[0]['generated_text']
+        if batching:
+            # Concurrent callers are grouped into one backend call by the shared worker
+            worker = get_inference_worker(models.get_generator)
+            model_output = worker.generate(prompts.format(top_video=video_description), max_new_tokens)
+        else:
+            stream = stream_inference(video_description, max_new_tokens)
+            model_output = ''.join(stream)
     except Exception as e:
         print(f"An error occurred during generation: {str(e)}")
         return None
 
+    store_recommendation(video_description, model_output, embedding, max_new_tokens)
+    return model_output
 
-def get_summarized(result):
-    summarized_text = []
-    for text in result:
-        if len(text) > 1024:
-            text = text[:1024]
 
-        if len(text) <= 20:
-            summarized_text.append(text)
-        else:
-            summary = summarizer(text, max_length=60, min_length=20, do_sample=False)
-            summarized_text.append(summary[0]['summary_text'])
+@traced()
+def get_summarized(result, batch_size=SUMMARY_BATCH_SIZE):
+    # Summaries are cached by content, so only unseen texts reach the summarizer
+    return cached_summaries(result, models.summarizer_id, lambda texts: summarize_batch(texts, batch_size))
+
+
+def summarize_batch(texts, batch_size=SUMMARY_BATCH_SIZE):
+    texts = list(texts)
+    summarized_text = list(texts)
+
+    # Very short texts are kept as they are
+    indices = [i for i, text in enumerate(texts) if len(text) > 20]
+    if not indices:
+        return summarized_text
+
+    # Sorting by token length keeps similarly sized inputs in the same batch and reduces padding
+    summarizer = models.get_summarizer()
+    token_ids = summarizer.tokenizer([texts[i] for i in indices], truncation=True)['input_ids']
+    order = sorted(range(len(indices)), key=lambda j: len(token_ids[j]))
+    sorted_texts = [texts[indices[j]] for j in order]
+
+    record('summarizer_input_tokens', sum(len(ids) for ids in token_ids))
+    summaries = traced('model.summarize')(summarizer)(sorted_texts, batch_size=batch_size, truncation=True,
+                                                      max_length=60, min_length=20, do_sample=False)
+
+    for j, summary in zip(order, summaries):
+        summarized_text[indices[j]] = summary['summary_text']
 
     return summarized_text
 
 
-def closest_to_centroid(centroid, embeddings):
-    distances = np.linalg.norm(embeddings - centroid, axis=1)
-    return np.argmin(distances)
+@traced()
+def encode_texts(texts):
+    return cached_embeddings(texts, models.embedder_id, traced('model.encode')(lambda batch: models.get_embedder().encode(batch)))
 
+
+@traced()
 def postprocess_model_output(model_output):
     print(model_output)
-    recommendation = model_output.split("Provide your recommend content below:")[1]
+    # Backends only return the generated continuation, older outputs still contain the prompt
+    recommendation = model_output.split("Provide your recommend content below:")[-1]
     output_parser = StrOutputParser()
     recommendation = output_parser.parse(recommendation)
     
     return recommendation
-
-def process_distribution(df, group_by, value_column=None):
-    month_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-    day_of_week_order = list(calendar.day_name)
-        
-    if value_column:
-        distribution = df.groupby(group_by, as_index=False)[value_column].mean()
-    else:
-        distribution = df.groupby(group_by, as_index=False).size().rename(columns={'size': 'Count'})
-
-    if group_by == 'Month':
-        distribution[group_by] = pd.Categorical(distribution[group_by], categories=month_order, ordered=True)
-    elif group_by == 'Day_of_Week':
-        distribution[group_by] = pd.Categorical(distribution[group_by], categories=day_of_week_order, ordered=True)
-
-    return distribution.sort_values(group_by)
\ No newline at end of file
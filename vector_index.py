@@ -0,0 +1,189 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, saves are then only serialized within this process
+    fcntl = None
+
+from constants import VECTOR_INDEX_PATH, IVF_MIN_SIZE, IVF_NPROBE
+from representatives import normalize
+
+
+class VideoIndex:
+    """
+        Nearest-neighbour index over MiniLM embeddings of previously fetched videos.
+
+        Search is exact (one matrix product) for small indexes and IVF for large ones:
+        embeddings are bucketed by their nearest coarse centroid and only the nprobe
+        closest buckets are scanned.
+
+        Parameters:
+        - path (str): .npz file the embeddings and metadata are persisted to.
+        - ivf_min_size (int): Index size from which the approximate search mode is used.
+        - nprobe (int): Buckets scanned per approximate query.
+    """
+
+    def __init__(self, path=VECTOR_INDEX_PATH, ivf_min_size=IVF_MIN_SIZE, nprobe=IVF_NPROBE):
+        self.path = path
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.video_ids = []
+        self.texts = []
+        self.category_ids = []
+        self._positions = {}
+        self._centroids = None
+        self._assignments = None
+        self._ivf_size = 0
+        # Category of every row as an array, rebuilt after videos were added, for vectorized filtering
+        self._category_array = np.zeros(0, dtype=str)
+        self._lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def __contains__(self, video_id):
+        return video_id in self._positions
+
+    def clear(self):
+        with self._lock:
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+            self.video_ids, self.texts, self.category_ids = [], [], []
+            self._positions = {}
+            self._centroids = None
+            self._assignments = None
+            self._category_array = np.zeros(0, dtype=str)
+
+    @staticmethod
+    def _read(path):
+        # Returns (video_ids, texts, category_ids, embeddings) stored at path
+        with np.load(path) as data:
+            return (data['video_ids'].tolist(), data['texts'].tolist(),
+                    [category_id or None for category_id in data['category_ids'].tolist()], data['embeddings'])
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes load-merge-write between the processes sharing the index file
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        video_ids, texts, category_ids, embeddings = self._read(self.path)
+        with self._lock:
+            self._append(video_ids, texts, category_ids, embeddings)
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._file_lock(), self._lock:
+            # Videos added by other processes since this one loaded the index are merged in, not overwritten
+            if os.path.exists(self.path):
+                self._append(*self._read(self.path))
+            temporary = f'{self.path}.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as f:
+                np.savez(f, embeddings=self.embeddings, video_ids=np.asarray(self.video_ids, dtype=str),
+                         texts=np.asarray(self.texts, dtype=str),
+                         category_ids=np.asarray([category_id or '' for category_id in self.category_ids], dtype=str))
+            os.replace(temporary, self.path)
+
+    def add(self, video_ids, texts, category_ids, embeddings):
+        embeddings = normalize(embeddings)
+        with self._lock:
+            self._append(video_ids, texts, category_ids, embeddings)
+
+    def _append(self, video_ids, texts, category_ids, embeddings):
+        # embeddings are already normalized, videos that are indexed already are skipped
+        new = [i for i, video_id in enumerate(video_ids) if video_id not in self._positions]
+        if not new:
+            return
+        start = len(self.video_ids)
+        for offset, i in enumerate(new):
+            self._positions[video_ids[i]] = start + offset
+            self.video_ids.append(video_ids[i])
+            self.texts.append(texts[i])
+            self.category_ids.append(category_ids[i])
+        if len(self.embeddings) == 0:
+            self.embeddings = embeddings[new]
+        else:
+            self.embeddings = np.vstack([self.embeddings, embeddings[new]])
+
+        if self._centroids is not None:
+            if len(self.video_ids) > 2 * self._ivf_size:
+                self._centroids = None
+            else:
+                # New rows join the bucket of their nearest centroid until the next rebuild
+                assignments = np.argmax(embeddings[new] @ self._centroids.T, axis=1)
+                self._assignments = np.concatenate([self._assignments, assignments])
+
+    def _build_ivf(self):
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_lists = max(1, int(np.sqrt(len(self.embeddings))))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, n_init=1, random_state=0,
+                                 batch_size=min(4096, len(self.embeddings))).fit(self.embeddings)
+        self._centroids = normalize(kmeans.cluster_centers_)
+        self._assignments = np.argmax(self.embeddings @ self._centroids.T, axis=1)
+        self._ivf_size = len(self.embeddings)
+
+    def _candidates(self, query, mode):
+        if mode == 'exact' or (mode == 'auto' and len(self.embeddings) < self.ivf_min_size):
+            return np.arange(len(self.embeddings))
+        if self._centroids is None:
+            self._build_ivf()
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return np.flatnonzero(np.isin(self._assignments, probes))
+
+    def search(self, query, k=10, mode='auto', exclude_ids=(), category_ids=None, min_score=None):
+        """
+            Return up to k (video_id, text, score) tuples most similar to the query embedding.
+
+            mode is 'exact', 'ivf' or 'auto' (IVF once the index holds ivf_min_size videos).
+        """
+        with self._lock:
+            if len(self.video_ids) == 0:
+                return []
+            query = normalize(np.asarray(query).reshape(1, -1))[0]
+            candidates = self._candidates(query, mode)
+
+            # Filters are applied to row numbers with numpy, the cost per query does not grow with Python loops
+            excluded = [self._positions[video_id] for video_id in exclude_ids if video_id in self._positions]
+            if excluded:
+                candidates = candidates[np.isin(candidates, excluded, invert=True)]
+            if category_ids is not None:
+                if len(self._category_array) != len(self.category_ids):
+                    self._category_array = np.asarray([category_id or '' for category_id in self.category_ids],
+                                                      dtype=str)
+                allowed = np.asarray([category_id for category_id in category_ids if category_id], dtype=str)
+                candidates = candidates[np.isin(self._category_array[candidates], allowed)]
+            if len(candidates) == 0:
+                return []
+
+            scores = self.embeddings[candidates] @ query
+            top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for j in top:
+                if min_score is not None and scores[j] < min_score:
+                    break
+                i = candidates[j]
+                results.append((self.video_ids[i], self.texts[i], float(scores[j])))
+            return results
+
+
+video_index = VideoIndex()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+class _IntColumn:
+    # int64 values plus a null mask, turned into a nullable Int64 column without copying through objects
+    def __init__(self):
+        self.values = array('q')
+        self.mask = array('b')
+
+    def append(self, value):
+        if value is None:
+            self.values.append(0)
+            self.mask.append(1)
+        else:
+            self.values.append(int(value))
+            self.mask.append(0)
+
+    def build(self):
+        return pd.arrays.IntegerArray(np.frombuffer(self.values, dtype=np.int64).copy(),
+                                      np.frombuffer(self.mask, dtype=np.int8).astype(bool))
+
+
+class VideoFrameBuilder:
+    """
+        Appends videos from a `videos` API response straight into typed columns.
+
+        Counts become nullable int64, dates UTC datetime64, languages and categories
+        categoricals; a missing field is a null rather than the previous video's value.
+
+        Parameters:
+        - descriptions (bool): Keep the Description column; without it descriptions are loaded
+          on demand with utility.load_descriptions.
+    """
+
+    # Approximate bytes per row for the fixed-width columns and per-object overhead
+    ROW_BYTES = 96
+
+    def __init__(self, descriptions=True):
+        self.keep_descriptions = descriptions
+        self.nbytes = 0
+        self.video_ids = []
+        self.titles = []
+        self.published = []
+        self.default_languages = []
+        self.audio_languages = []
+        self.category_ids = []
+        self.tags = []
+        self.descriptions = []
+        self.views = _IntColumn()
+        self.likes = _IntColumn()
+        self.comments = _IntColumn()
+
+    def __len__(self):
+        return len(self.video_ids)
+
+    def add(self, video):
+        snippet = video['snippet']
+        statistics = video.get('statistics', {})
+
+        self.video_ids.append(video['id'])
+        self.titles.append(snippet['title'])
+        self.published.append(snippet['publishedAt'])
+        self.default_languages.append(snippet.get('defaultLanguage'))
+        self.audio_languages.append(snippet.get('defaultAudioLanguage'))
+        self.category_ids.append(snippet.get('categoryId'))
+        tags = snippet.get('tags', [])
+        self.tags.append(tags)
+        self.nbytes += (self.ROW_BYTES + sys.getsizeof(video['id']) + sys.getsizeof(snippet['title'])
+                        + sum(sys.getsizeof(tag) + 8 for tag in tags))
+        if self.keep_descriptions:
+            self.descriptions.append(snippet.get('description', ''))
+            self.nbytes += sys.getsizeof(self.descriptions[-1])
+        self.views.append(statistics.get('viewCount'))
+        self.likes.append(statistics.get('likeCount'))
+        self.comments.append(statistics.get('commentCount'))
+
+    def add_many(self, videos):
+        for video in videos:
+            self.add(video)
+
+    def build(self):
+        columns = {
+            'Video_id': self.video_ids,
+            'Title': self.titles,
+            'Published_date': pd.to_datetime(self.published, format='ISO8601', utc=True),
+            'Default_language': pd.Categorical(self.default_languages),
+            'Views': self.views.build(),
+            'Likes': self.likes.build(),
+            'Comments': self.comments.build(),
+            'Category_id': pd.Categorical(self.category_ids),
+            'Tags': self.tags,
+            'Description': self.descriptions,
+            'Audio_language': pd.Categorical(self.audio_languages),
+        }
+        if not self.keep_descriptions:
+            del columns['Description']
+        return pd.DataFrame(columns)
\ No newline at end of file